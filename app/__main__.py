@@ -0,0 +1,9 @@
+#this script shall let the app run as python -m app
+
+import sys
+
+from .cli import main
+
+
+if __name__ == "__main__":
+    sys.exit(main())
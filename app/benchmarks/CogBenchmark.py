@@ -0,0 +1,63 @@
+#this script shall compare the size and read speed of plain and cloud-optimised merge outputs
+# usage: python -m app.benchmarks.CogBenchmark --tiles 4 4 --tile-size 1000
+
+import os
+import time
+import argparse
+import tempfile
+import rasterio
+from rasterio.windows import Window
+
+from ..processing.MergeRaster import merge_raster
+from ..processing.RasterOutput import RasterOutput
+from .SyntheticData import make_dem_tiles
+
+
+# the output layouts being compared
+VARIANTS = {"plain": RasterOutput(),
+            "cog-deflate": RasterOutput(cog=True, compress="DEFLATE"),
+            "cog-zstd": RasterOutput(cog=True, compress="ZSTD"),
+            "cog-lerc": RasterOutput(cog=True, compress="LERC", max_z_error=0.001)}
+
+
+def time_window_read(path: str, size: int) -> float:
+    """Time reading a full resolution window from the centre of the raster"""
+    start = time.perf_counter()
+    with rasterio.open(path) as src:
+        window = Window((src.width - size) // 2, (src.height - size) // 2, size, size)
+        src.read(1, window=window)
+    return time.perf_counter() - start
+
+
+def time_preview_read(path: str, factor: int) -> float:
+    """Time reading the whole raster decimated by factor, as a map preview would"""
+    start = time.perf_counter()
+    with rasterio.open(path) as src:
+        src.read(1, out_shape=(max(1, src.height // factor), max(1, src.width // factor)))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the file size and read times of the raster output layouts")
+    parser.add_argument("--tiles", nargs=2, type=int, default=[4, 4], metavar=("NX", "NY"))
+    parser.add_argument("--tile-size", type=int, default=1000)
+    parser.add_argument("--window", type=int, default=512)
+    parser.add_argument("--preview-factor", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_dem_tiles(os.path.join(tmp, "tiles"), args.tiles[0], args.tiles[1], args.tile_size)
+        print(f"{'variant':>12} {'write s':>9} {'size MB':>9} {'window s':>9} {'preview s':>10}")
+        for name, output in VARIANTS.items():
+            output_path = os.path.join(tmp, f"{name}.tif")
+            start = time.perf_counter()
+            merge_raster(paths, output_path, mode="stream", output=output)
+            write_time = time.perf_counter() - start
+            size_mb = os.path.getsize(output_path) / 1e6
+            window_time = time_window_read(output_path, args.window)
+            preview_time = time_preview_read(output_path, args.preview_factor)
+            print(f"{name:>12} {write_time:>9.2f} {size_mb:>9.1f} {window_time:>9.3f} {preview_time:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
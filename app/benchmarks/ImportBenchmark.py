@@ -0,0 +1,134 @@
+#this script shall measure what importing the modules of the app costs and which heavy packages each one pulls in
+# every import runs in a fresh interpreter with python -X importtime; the fastest of the repeats is kept
+# a raster crop run is measured the same way, since most of the packages of a run are imported on first use
+# usage: python -m app.benchmarks.ImportBenchmark --modules app.cli app.processing.ShapeCropper --repeat 5 --top 10
+
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+
+# the directory app is imported from by the measured processes
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# the modules measured by default: the command line, the package and the entry points of the crops and merges
+MODULES = ("app.cli", "app.processing", "app.processing.ShapeCropper", "app.processing.CropTasks",
+           "app.processing.MergeRaster")
+# the packages whose import is worth knowing about
+HEAVY_PACKAGES = ("geopandas", "pandas", "rasterio", "pyproj", "fiona", "pyogrio", "shapely", "numpy", "dask")
+
+
+# a raster-only crop with a cold geometry cache, run by the crop measurement; the paths are filled in per run
+RASTER_CROP = """
+from app.processing.ShapeCropper import Application, GeoData, RasterCropper
+geo_data = GeoData(shapefile_path={shapefile_path!r}, raster_path={raster_path!r}, output_path={output_path!r})
+Application(geo_data, RasterCropper(geo_data), use_build_cache=False).execute()
+"""
+
+
+def import_times(statement: str, env: Optional[Dict[str, str]]=None) -> Tuple[Dict[str, int], int]:
+    """The cumulative import time in microseconds of every top-level package imported by the statement, and their total
+
+    The total adds up the imports made directly by the statement, so nested ones are counted once.
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                               cwd=REPO_ROOT, capture_output=True, text=True, env=env)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{statement} failed: {completed.stderr.strip().splitlines()[-1]}")
+    times: Dict[str, int] = {}
+    total = 0
+    # the lines read "import time: <self us> | <cumulative us> | <indented module>"
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        package = module.strip().split(".")[0]
+        # a package imported from several places is counted once, at its largest cumulative time
+        times[package] = max(times.get(package, 0), int(cumulative))
+        # the imports of the statement itself are indented by a single space, the nested ones by more
+        if not module[1:].startswith(" "):
+            total += int(cumulative)
+    return times, total
+
+
+def measure(module: str, repeat: int) -> Tuple[float, Dict[str, int]]:
+    """The fastest total import time of a module in milliseconds over repeat runs, with the packages of that run"""
+    runs = []
+    for _ in range(repeat):
+        times, _ = import_times(f"import {module}")
+        runs.append((times.get(module.split(".")[0], 0) / 1e3, times))
+    return min(runs, key=lambda run: run[0])
+
+
+def baseline(repeat: int) -> Tuple[float, Dict[str, int]]:
+    """The fastest start-up of a bare interpreter in milliseconds with its packages, to tell the cost of the app from that of python"""
+    runs = [import_times("pass") for _ in range(repeat)]
+    return min(total for _, total in runs) / 1e3, runs[0][0]
+
+
+def measure_raster_crop(repeat: int) -> Tuple[float, Dict[str, int]]:
+    """The fastest import time in milliseconds of a raster crop run on synthetic data, with the packages of that run
+
+    The time is that of every import made during the run, python start-up included, since the
+    app imports most packages where they are first used rather than at the top of its modules.
+    """
+    from .SyntheticData import make_clip_polygon, make_dem_tiles
+
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        raster_path = make_dem_tiles(os.path.join(tmp, "tiles"), 1, 1, tile_size=256)[0]
+        shapefile_path = os.path.join(tmp, "boundary.shp")
+        make_clip_polygon(64, extent=256.0).to_file(shapefile_path)
+        for i in range(repeat):
+            statement = RASTER_CROP.format(shapefile_path=shapefile_path, raster_path=raster_path,
+                                           output_path=os.path.join(tmp, f"output_{i}"))
+            # a cache directory of its own per run, so the clip layer is read on every run
+            env = dict(os.environ, GEO_APP_CACHE_DIR=os.path.join(tmp, f"cache_{i}"))
+            times, total = import_times(statement, env)
+            runs.append((total / 1e3, times))
+    return min(runs, key=lambda run: run[0])
+
+
+def report(module: str, milliseconds: float, times: Dict[str, int], top: int, start_up: Dict[str, int]) -> None:
+    """Print the import time of a module, the heavy packages it loaded and the slowest packages python does not load anyway"""
+    loaded = [package for package in HEAVY_PACKAGES if package in times]
+    print(f"{module:<32} {milliseconds:>8.1f} ms  heavy: {', '.join(loaded) or 'none'}")
+    slowest: List[Tuple[str, int]] = sorted([item for item in times.items() if item[0] not in start_up], key=lambda item: item[1], reverse=True)[:top]
+    for package, cumulative in slowest:
+        print(f"{'':<4}{package:<28} {cumulative / 1e3:>8.1f} ms")
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the import time of the modules of the app and the heavy packages they load")
+    parser.add_argument("--modules", nargs="+", default=list(MODULES))
+    parser.add_argument("--repeat", type=int, default=5)
+    # the number of slowest packages listed per module
+    parser.add_argument("--top", type=int, default=8)
+    # also measure the imports of a raster-only crop run; it needs numpy, rasterio and geopandas to write its data
+    parser.add_argument("--no-raster-crop", dest="raster_crop", action="store_false")
+    args = parser.parse_args()
+
+    start_up_ms, start_up = baseline(args.repeat)
+    print(f"{'python start-up':<32} {start_up_ms:>8.1f} ms")
+    for module in args.modules:
+        try:
+            milliseconds, times = measure(module, args.repeat)
+        except RuntimeError as error:
+            print(f"{module:<32} {'failed':>11}  {error}")
+            continue
+        report(module, milliseconds, times, args.top, start_up)
+    if args.raster_crop:
+        try:
+            milliseconds, times = measure_raster_crop(args.repeat)
+        except (ImportError, RuntimeError) as error:
+            print(f"{'raster crop run':<32} {'failed':>11}  {error}")
+            return None
+        report("raster crop run", milliseconds, times, args.top, start_up)
+    return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#this script shall measure how the streaming merge scales with the number of workers
+# usage: python -m app.benchmarks.MergeBenchmark --tiles 8 8 --tile-size 1000 --workers 1 2 4 8
+
+import os
+import time
+import hashlib
+import argparse
+import tempfile
+import rasterio
+
+from ..processing.MergeRaster import merge_raster
+from .SyntheticData import make_dem_tiles
+
+
+def checksum(path: str) -> str:
+    """Hash the pixel data of a raster so outputs can be compared across runs"""
+    digest = hashlib.sha256()
+    with rasterio.open(path) as src:
+        for _, window in src.block_windows(1):
+            digest.update(src.read(window=window).tobytes())
+    return digest.hexdigest()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the streaming merge against the number of workers")
+    parser.add_argument("--tiles", nargs=2, type=int, default=[8, 8], metavar=("NX", "NY"))
+    parser.add_argument("--tile-size", type=int, default=1000)
+    parser.add_argument("--block-size", type=int, default=512)
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_dem_tiles(os.path.join(tmp, "tiles"), args.tiles[0], args.tiles[1], args.tile_size)
+        results = []
+        for workers in args.workers:
+            output_path = os.path.join(tmp, f"merged_{workers}.tif")
+            start = time.perf_counter()
+            merge_raster(paths, output_path, mode="stream", block_size=args.block_size, workers=workers)
+            results.append((workers, time.perf_counter() - start, checksum(output_path)))
+
+    # the serial run is the baseline for both speed-up and output equality
+    baseline_time, baseline_hash = results[0][1], results[0][2]
+    print(f"{'workers':>8} {'seconds':>10} {'speed-up':>9}  identical")
+    for workers, seconds, digest in results:
+        print(f"{workers:>8} {seconds:>10.2f} {baseline_time / seconds:>8.2f}x  {digest == baseline_hash}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#this script shall benchmark the merge and crop hot paths on synthetic data and save the results as JSON
+# every case runs in a fresh process so its peak RSS and bytes read are its own
+# usage: python -m app.benchmarks.Suite --tiles 4 4 --vertices 8 512 4096 --features 10000 1000000 --output bench.json
+#        python -m app.benchmarks.Suite --compare old.json new.json
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from ..utils.Instrumentation import io_counters, peak_rss_mb
+from .SyntheticData import make_clip_polygon, make_dem_tiles, make_footprints
+
+
+# the directory app is imported from by the case processes
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# the cases of the suite; the crop cases run once per polygon vertex count or feature count
+CASES = ("merge_memory", "merge_stream", "raster_crop", "vector_crop", "both_crop")
+
+
+def prepare_data(data_dir: str, args: argparse.Namespace) -> dict:
+    """Synthesise the tiles, clip polygons and vector layers once, reusing what a previous run left in data_dir"""
+    from ..processing.MergeRaster import merge_raster
+
+    extent = args.tiles[0] * args.tile_size
+    tile_dir = os.path.join(data_dir, f"tiles_{args.tiles[0]}x{args.tiles[1]}_{args.tile_size}")
+    tiles = sorted(glob.glob(os.path.join(tile_dir, "*.tif")))
+    if len(tiles) != args.tiles[0] * args.tiles[1]:
+        tiles = make_dem_tiles(tile_dir, args.tiles[0], args.tiles[1], args.tile_size)
+    # the crops read the tiles through a VRT mosaic so they only touch the tiles under the polygon
+    mosaic = os.path.join(data_dir, f"mosaic_{args.tiles[0]}x{args.tiles[1]}_{args.tile_size}.vrt")
+    merge_raster(tiles, mosaic, mode="vrt")
+
+    clips = {}
+    for vertices in args.vertices:
+        clips[vertices] = os.path.join(data_dir, f"clip_{vertices}.shp")
+        if not os.path.exists(clips[vertices]):
+            make_clip_polygon(vertices, extent).to_file(clips[vertices])
+    vectors = {}
+    for features in args.features:
+        vectors[features] = os.path.join(data_dir, f"footprints_{features}.gpkg")
+        if not os.path.exists(vectors[features]):
+            make_footprints(features, extent).to_file(vectors[features])
+    return {"tiles": tiles, "mosaic": mosaic, "clips": clips, "vectors": vectors}
+
+
+def plan_cases(data: dict, args: argparse.Namespace) -> List[dict]:
+    """The specification of every case to run"""
+    clip = data["clips"][args.vertices[len(args.vertices) // 2]]
+    features = args.features[0]
+    specs = []
+    for case in args.cases:
+        if case in ("merge_memory", "merge_stream"):
+            specs.append({"case": case, "params": {"tiles": len(data["tiles"])}, "tiles": data["tiles"]})
+        elif case == "raster_crop":
+            specs += [{"case": case, "params": {"vertices": vertices}, "raster": data["mosaic"], "clip": data["clips"][vertices]}
+                      for vertices in args.vertices]
+        elif case == "vector_crop":
+            specs += [{"case": case, "params": {"features": n}, "vector": data["vectors"][n], "clip": clip}
+                      for n in args.features]
+        elif case == "both_crop":
+            specs.append({"case": case, "params": {"features": features}, "raster": data["mosaic"],
+                          "vector": data["vectors"][features], "clip": clip})
+    return specs
+
+
+def run_case(spec: dict, output_dir: str) -> dict:
+    """Run one case in this process and measure it"""
+    from ..processing.MergeRaster import merge_raster
+    from ..processing.ShapeCropper import Application, BothCropper, GeoData, RasterCropper, VectorCropper
+
+    case = spec["case"]
+    # build the work before the clock starts so only the hot path is measured
+    if case.startswith("merge"):
+        mode = case.split("_")[1]
+        work = lambda: merge_raster(spec["tiles"], os.path.join(output_dir, "merged.tif"), mode=mode)
+    else:
+        geo_data = GeoData(shapefile_path=spec["clip"], raster_path=spec.get("raster"), vector_path=spec.get("vector"),
+                           output_path=output_dir, crop_engine=spec.get("engine", "windowed"),
+                           vector_engine=spec.get("vector_engine", "index"))
+        cropper = {"raster_crop": RasterCropper, "vector_crop": VectorCropper, "both_crop": BothCropper}[case](geo_data)
+        work = Application(geo_data, cropper, use_build_cache=False).execute
+
+    rss_before = peak_rss_mb()
+    io_before = io_counters()
+    cpu_start, start = time.process_time(), time.perf_counter()
+    work()
+    wall, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+    io_after = io_counters()
+    return {"case": case,
+            "params": spec["params"],
+            "wall_s": wall,
+            "cpu_s": cpu,
+            "peak_rss_mb": peak_rss_mb(),
+            "rss_before_mb": rss_before,
+            # bytes fetched from storage, and bytes read through any read call including the page cache
+            "read_bytes": io_after.get("read_bytes", 0) - io_before.get("read_bytes", 0) if io_before else None,
+            "rchar": io_after.get("rchar", 0) - io_before.get("rchar", 0) if io_before else None,
+            "write_bytes": io_after.get("write_bytes", 0) - io_before.get("write_bytes", 0) if io_before else None}
+
+
+def run_isolated(spec: dict, repeat: int) -> dict:
+    """Run a case repeat times, each in a fresh interpreter, and keep the fastest run with every wall time"""
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            # a private geometry cache so no run is served from the on-disk cache of an earlier one
+            env = dict(os.environ, GEO_APP_CACHE_DIR=os.path.join(tmp, "cache"), GEO_APP_INSTRUMENT="0")
+            completed = subprocess.run([sys.executable, "-m", "app.benchmarks.Suite", "--run-case", json.dumps(spec),
+                                        "--case-output", os.path.join(tmp, "output")],
+                                       cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True)
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    result = min(runs, key=lambda run: run["wall_s"])
+    result["wall_s_runs"] = [run["wall_s"] for run in runs]
+    return result
+
+
+def git_commit() -> Optional[str]:
+    """The commit of the working tree, so results can be compared across commits"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """Print the wall time, peak RSS and bytes read of two result files side by side"""
+    with open(old_path) as f:
+        old = {(r["case"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+    print(f"{'case':>14} {'params':>22} {'wall s':>9} {'vs old':>7} {'peak MB':>9} {'vs old':>7} {'read MB':>9}")
+    for result in new:
+        before = old.get((result["case"], json.dumps(result["params"], sort_keys=True)))
+        wall_ratio = f"{result['wall_s'] / before['wall_s']:.2f}x" if before else "-"
+        rss_ratio = f"{result['peak_rss_mb'] / before['peak_rss_mb']:.2f}x" if before and result["peak_rss_mb"] and before["peak_rss_mb"] else "-"
+        read_mb = (result["read_bytes"] or 0) / 1e6
+        print(f"{result['case']:>14} {json.dumps(result['params']):>22} {result['wall_s']:>9.2f} {wall_ratio:>7} "
+              f"{result['peak_rss_mb'] or 0:>9.0f} {rss_ratio:>7} {read_mb:>9.1f}")
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark merge, raster crop, vector crop and combined crop on synthetic data")
+    parser.add_argument("--tiles", nargs=2, type=int, default=[4, 4], metavar=("NX", "NY"))
+    parser.add_argument("--tile-size", type=int, default=1000)
+    # the vertex counts of the clip polygons and the feature counts of the vector layers (up to 10000000)
+    parser.add_argument("--vertices", nargs="+", type=int, default=[8, 512, 4096])
+    parser.add_argument("--features", nargs="+", type=int, default=[10000, 100000, 1000000])
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=3)
+    # where the synthetic data is kept; it is reused by later runs with the same sizes
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "geo_app_benchmark"))
+    parser.add_argument("--output", help="the JSON file of the results; defaults to benchmark_<commit>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    # internal: run a single case in this process and print its measurements
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--case-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return None
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case), args.case_output)))
+        return None
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    data = prepare_data(args.data_dir, args)
+    results = []
+    for spec in plan_cases(data, args):
+        result = run_isolated(spec, args.repeat)
+        results.append(result)
+        print(f"{result['case']:>14} {json.dumps(result['params']):>22} {result['wall_s']:>8.2f}s "
+              f"{result['peak_rss_mb'] or 0:>7.0f} MB peak {(result['read_bytes'] or 0) / 1e6:>9.1f} MB read")
+
+    commit = git_commit()
+    output = args.output or f"benchmark_{commit or 'worktree'}.json"
+    with open(output, "w") as f:
+        json.dump({"commit": commit,
+                   "created": datetime.now(timezone.utc).isoformat(),
+                   "python": platform.python_version(),
+                   "platform": platform.platform(),
+                   "config": {name: value for name, value in vars(args).items() if name not in ("run_case", "case_output", "compare")},
+                   "results": results}, f, indent=2)
+    print(f"results saved to {output}")
+    return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#this script shall synthesise deterministic test data for the benchmarks
+
+import os
+import numpy as np
+import geopandas as gpd
+import rasterio
+import shapely
+from rasterio.transform import from_origin
+from typing import List
+
+
+# the origin and crs of the synthetic grids (NZTM)
+ORIGIN_X = 1700000.0
+ORIGIN_Y = 5900000.0
+CRS = "EPSG:2193"
+
+
+def make_dem_tiles(output_dir: str, nx: int, ny: int, tile_size: int=1000, res: float=1.0, seed: int=0) -> List[str]:
+    """Write a nx by ny grid of DEM tiles of tile_size pixels and return their paths"""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for j in range(ny):
+        for i in range(nx):
+            left = ORIGIN_X + i * tile_size * res
+            top = ORIGIN_Y - j * tile_size * res
+            path = os.path.join(output_dir, f"dem_{j:03d}_{i:03d}.tif")
+            meta = {"driver": "GTiff",
+                    "dtype": "float32",
+                    "count": 1,
+                    "crs": CRS,
+                    "nodata": -9999.0,
+                    "width": tile_size,
+                    "height": tile_size,
+                    "transform": from_origin(left, top, res, res),
+                    "tiled": True,
+                    "blockxsize": 256,
+                    "blockysize": 256}
+            with rasterio.open(path, "w", **meta) as dst:
+                dst.write(_terrain(left, top, tile_size, res, seed + j * nx + i), 1)
+            paths.append(path)
+    return paths
+
+
+def _terrain(left: float, top: float, size: int, res: float, seed: int) -> np.ndarray:
+    """Smooth rolling terrain with a little seeded noise so tiles compress like a real DEM"""
+    x = left + (np.arange(size, dtype=np.float64) + 0.5) * res
+    y = top - (np.arange(size, dtype=np.float64) + 0.5) * res
+    xx, yy = np.meshgrid(x - ORIGIN_X, ORIGIN_Y - y)
+    surface = 100.0 + 25.0 * np.sin(xx / 700.0) * np.cos(yy / 900.0) + 0.01 * (xx + yy) / res
+    noise = np.random.default_rng(seed).normal(0.0, 0.05, size=(size, size))
+    return (surface + noise).astype("float32")
+
+
+def make_footprints(n: int, extent: float=10000.0, size: float=15.0, seed: int=0) -> gpd.GeoDataFrame:
+    """Scatter n square building footprints over an extent by extent area"""
+    rng = np.random.default_rng(seed)
+    x = ORIGIN_X + rng.uniform(0.0, extent, n)
+    y = ORIGIN_Y - rng.uniform(0.0, extent, n)
+    half = rng.uniform(0.25, 0.5, n) * size
+    return gpd.GeoDataFrame({"id": np.arange(n), "height": rng.uniform(3.0, 30.0, n).round(1)},
+                            geometry=shapely.box(x - half, y - half, x + half, y + half), crs=CRS)
+
+
+def make_clip_polygon(vertices: int, extent: float=10000.0, seed: int=0) -> gpd.GeoDataFrame:
+    """A jagged polygon of the given number of vertices covering about a third of an extent by extent area"""
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0.0, 2.0 * np.pi, vertices, endpoint=False)
+    # the radius wobbles so the boundary crosses many blocks and features like a real catchment would
+    radius = extent * (0.3 + 0.05 * rng.uniform(-1.0, 1.0, vertices))
+    x = ORIGIN_X + extent / 2 + radius * np.cos(angles)
+    y = ORIGIN_Y - extent / 2 + radius * np.sin(angles)
+    return gpd.GeoDataFrame({"name": ["catchment"]}, geometry=[shapely.Polygon(np.column_stack([x, y]))], crs=CRS)
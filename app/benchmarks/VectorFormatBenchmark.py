@@ -0,0 +1,55 @@
+#this script shall compare writing and reading the vector output formats
+# usage: python -m app.benchmarks.VectorFormatBenchmark --features 1000000
+
+import os
+import glob
+import time
+import argparse
+import tempfile
+import geopandas as gpd
+
+from ..processing.VectorOutput import VECTOR_FORMATS, VectorOutput
+from .SyntheticData import ORIGIN_X, ORIGIN_Y, make_footprints
+
+
+def file_size(path: str) -> int:
+    """Size of an output including the sidecar files of a shapefile"""
+    stem = os.path.splitext(path)[0]
+    return sum(os.path.getsize(p) for p in glob.glob(stem + ".*"))
+
+
+def read_bbox(path: str, bbox: tuple) -> gpd.GeoDataFrame:
+    """Read the features of an output that intersect bbox"""
+    if path.endswith(".parquet"):
+        return gpd.read_parquet(path, bbox=bbox)
+    return gpd.read_file(path, bbox=bbox)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark write time, size and bbox read time of the vector formats")
+    parser.add_argument("--features", type=int, default=1000000)
+    parser.add_argument("--extent", type=float, default=10000.0)
+    # the side of the bbox read back, as a fraction of the extent
+    parser.add_argument("--bbox-fraction", type=float, default=0.05)
+    args = parser.parse_args()
+
+    frame = make_footprints(args.features, args.extent)
+    side = args.extent * args.bbox_fraction
+    left, top = ORIGIN_X + (args.extent - side) / 2, ORIGIN_Y - (args.extent - side) / 2
+    bbox = (left, top - side, left + side, top)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'format':>8} {'write s':>9} {'size MB':>9} {'bbox read s':>12} {'features':>9}")
+        for name in VECTOR_FORMATS:
+            output = VectorOutput(format=name)
+            start = time.perf_counter()
+            path = output.write(frame, tmp, name=f"footprints_{name}")
+            write_time = time.perf_counter() - start
+            start = time.perf_counter()
+            count = len(read_bbox(path, bbox))
+            read_time = time.perf_counter() - start
+            print(f"{name:>8} {write_time:>9.2f} {file_size(path) / 1e6:>9.1f} {read_time:>12.3f} {count:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+#this script shall run the merge and crop tasks of a job file in one process so imports and caches are paid once
+# usage: python -m app run jobs.yaml --workers 4 --summary
+#        python -m app serve --port 8765 --workers 2   (a job server that keeps the workers warm, see service.py)
+#
+# a job file (YAML, TOML or JSON) lists the tasks in the order they run; relative paths are taken from the
+# directory of the job file, and defaults.merge / defaults.crop are applied to every task of that type:
+#
+#   workers: 4
+#   defaults:
+#     crop: {crop_engine: windowed, raster_output: {compress: ZSTD}}
+#   tasks:
+#     - {name: dem, type: merge, raster_paths: "tiles/*.tif", output_path: out/dem.tif, mode: stream, workers: 4}
+#     - {name: catchment, type: crop, shapefile_path: catchment.shp, raster_path: out/dem.tif, output_path: out/catchment}
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field, fields
+from typing import Callable, Dict, List, Optional
+
+
+# the kinds of task a job file can hold
+TASK_TYPES = ("merge", "crop")
+# the croppers a crop task can ask for; auto picks one from the inputs
+CROPPERS = ("auto", "raster", "vector", "both", "multi", "batch")
+# the options of a task that hold paths, resolved against the directory of the job file
+PATH_OPTIONS = {"merge": ("raster_paths", "output_path", "index_path"),
+                "crop": ("shapefile_path", "raster_path", "vector_path", "output_path")}
+# the options of a crop task handled here rather than by GeoData
+CROP_OPTIONS = ("cropper", "use_build_cache", "profile", "name_field", "group_distance", "max_group_pixels")
+
+
+@dataclass
+class TaskResult:
+    """Class to hold the outcome of one task of a job"""
+    name: str
+    type: str
+    status: str = "pending"
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class Job:
+    """Class to hold the tasks of a job file and the context they share"""
+    tasks: List[dict]
+    base_dir: str = "."
+    defaults: Dict[str, dict] = field(default_factory=dict)
+    # the size of the process pool shared by the crop tasks
+    workers: int = 1
+
+
+def load_job(path: str) -> Job:
+    """Read a YAML, TOML or JSON job file"""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "rb") as f:
+        if ext == ".toml":
+            try:
+                import tomllib
+            except ImportError:
+                import tomli as tomllib
+            document = tomllib.load(f)
+        elif ext in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML job files need PyYAML; install it with `pip install pyyaml` or use TOML.")
+            document = yaml.safe_load(f) or {}
+        elif ext == ".json":
+            document = json.load(f)
+        else:
+            raise ValueError(f"The job file should be .yaml, .yml, .toml or .json: {path}")
+    return job_from_dict(document, os.path.dirname(os.path.abspath(path)))
+
+
+def job_from_dict(document: dict, base_dir: str=".") -> Job:
+    """Build a job from a parsed job file, checking every task before any runs"""
+    tasks = document.get("tasks") or []
+    if not isinstance(tasks, list) or not tasks:
+        raise ValueError("A job file should list at least one task under tasks.")
+    job = Job(tasks=[], base_dir=base_dir, defaults=document.get("defaults") or {}, workers=int(document.get("workers", 1)))
+    names = set()
+    for number, task in enumerate(tasks, start=1):
+        task = dict(task)
+        kind = task.get("type")
+        if kind not in TASK_TYPES:
+            raise ValueError(f"Task {number} should have a type of {', '.join(TASK_TYPES)}.")
+        task = {**job.defaults.get(kind, {}), **task}
+        task.setdefault("name", f"{kind}_{number}")
+        if task["name"] in names:
+            raise ValueError(f"Two tasks are named {task['name']}.")
+        names.add(task["name"])
+        _check_options(task)
+        job.tasks.append(task)
+    return job
+
+
+def _check_options(task: dict) -> None:
+    """Reject unknown options up front so a typo fails the job before any work is done"""
+    import inspect
+    if task["type"] == "merge":
+        from .processing.MergeRaster import merge_raster
+        # profile stands in for the profiler of merge_raster, like for the crop tasks
+        allowed = set(inspect.signature(merge_raster).parameters) - {"profiler"} | {"profile"}
+    else:
+        from .processing.ShapeCropper import GeoData
+        allowed = {f.name for f in fields(GeoData)} | set(CROP_OPTIONS)
+        if task.get("cropper", "auto") not in CROPPERS:
+            raise ValueError(f"{task['name']}: cropper should be one of {', '.join(CROPPERS)}.")
+    unknown = set(task) - allowed - {"type", "name"}
+    if unknown:
+        raise ValueError(f"{task['name']}: unknown options {', '.join(sorted(unknown))}.")
+    required = "raster_paths" if task["type"] == "merge" else "shapefile_path"
+    if not task.get(required):
+        raise ValueError(f"{task['name']}: {required} is required.")
+    return None
+
+
+def _resolve_paths(task: dict, base_dir: str) -> dict:
+    """The task with its paths taken relative to the job file"""
+    task = dict(task)
+    for key in PATH_OPTIONS[task["type"]]:
+        value = task.get(key)
+        if isinstance(value, str):
+            task[key] = os.path.join(base_dir, os.path.expanduser(value))
+        elif isinstance(value, list):
+            task[key] = [os.path.join(base_dir, os.path.expanduser(path)) for path in value]
+    return task
+
+
+def run_merge(task: dict) -> None:
+    """Run a merge task"""
+    from .processing.MergeRaster import merge_raster
+    from .processing.RasterOutput import RasterOutput
+    from .processing.ShapeCropper import expand_paths
+
+    options = {key: value for key, value in task.items() if key not in ("type", "name")}
+    options["raster_paths"] = expand_paths(options["raster_paths"])
+    if isinstance(options.get("output"), dict):
+        options["output"] = RasterOutput(**options["output"])
+    profile = options.pop("profile", None)
+    if profile:
+        options["profiler"] = _profiler(profile)
+    if options.get("output_path"):
+        os.makedirs(os.path.dirname(options["output_path"]) or ".", exist_ok=True)
+    merge_raster(**options)
+    return None
+
+
+def run_crop(task: dict, executor: Optional[Executor]=None) -> None:
+    """Run a crop task, sharing the process pool of the job"""
+    from .processing.RasterOutput import RasterOutput
+    from .processing.ShapeCropper import Application, GeoData
+    from .processing.VectorOutput import VectorOutput
+
+    options = {key: value for key, value in task.items() if key not in ("type", "name")}
+    extra = {key: options.pop(key) for key in CROP_OPTIONS if key in options}
+    if isinstance(options.get("raster_output"), dict):
+        options["raster_output"] = RasterOutput(**options["raster_output"])
+    if isinstance(options.get("vector_output"), dict):
+        options["vector_output"] = VectorOutput(**options["vector_output"])
+    geo_data = GeoData(**options)
+    cropper = make_cropper(geo_data, extra.get("cropper", "auto"),
+                           {key: extra[key] for key in ("name_field", "group_distance", "max_group_pixels") if key in extra})
+    Application(geo_data, cropper, use_build_cache=extra.get("use_build_cache", True),
+                profiler=_profiler(extra["profile"]) if extra.get("profile") else None, executor=executor).execute()
+    return None
+
+
+def make_cropper(geo_data, kind: str="auto", batch_options: Optional[dict]=None):
+    """The cropper of a kind for the geo data; auto picks it from the number of raster and vector files"""
+    from .processing.ShapeCropper import BothCropper, MultiCropper, RasterCropper, VectorCropper
+
+    if kind == "auto":
+        rasters, vectors = len(geo_data.raster_paths), len(geo_data.vector_paths)
+        if rasters <= 1 and vectors <= 1:
+            kind = "both" if rasters and vectors else "raster" if rasters else "vector"
+        else:
+            kind = "multi"
+    if kind == "batch":
+        from .processing.BatchCropper import BatchRasterCropper
+        return BatchRasterCropper(geo_data, workers=geo_data.workers, **(batch_options or {}))
+    return {"raster": RasterCropper, "vector": VectorCropper, "both": BothCropper, "multi": MultiCropper}[kind](geo_data)
+
+
+def _profiler(options):
+    """A profiler from the profile option of a task: true, or the fields of a Profiler"""
+    from .utils.Profiling import Profiler
+    return Profiler(**options) if isinstance(options, dict) else Profiler()
+
+
+def run_job(job: Job, only: Optional[List[str]]=None, keep_going: bool=False,
+            report: Callable[[TaskResult], None]=lambda result: None) -> List[TaskResult]:
+    """Run the tasks of a job in order in this process and return how each went
+
+    The crop tasks share one process pool of job.workers processes and the geometry cache of
+    this process. A failed task stops the job unless keep_going is set.
+    """
+    from .utils.Instrumentation import stage
+
+    results = [TaskResult(task["name"], task["type"]) for task in job.tasks]
+    executor = ProcessPoolExecutor(max_workers=job.workers) if job.workers > 1 else None
+    try:
+        for task, result in zip(job.tasks, results):
+            if only and task["name"] not in only:
+                result.status = "skipped"
+                continue
+            start = time.perf_counter()
+            try:
+                with stage("task", task=task["name"], type=task["type"]):
+                    if task["type"] == "merge":
+                        run_merge(_resolve_paths(task, job.base_dir))
+                    else:
+                        run_crop(_resolve_paths(task, job.base_dir), executor)
+                result.status = "ok"
+            except Exception as error:
+                result.status, result.error = "failed", f"{type(error).__name__}: {error}"
+            result.seconds = time.perf_counter() - start
+            report(result)
+            if result.status == "failed" and not keep_going:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return results
+
+
+def _print_result(result: TaskResult) -> None:
+    """Print one line per finished task"""
+    line = f"{result.name:<24} {result.type:<6} {result.status:<8} {result.seconds:>9.2f}s"
+    print(line + (f"  {result.error}" if result.error else ""), flush=True)
+    return None
+
+
+def _run(args: argparse.Namespace) -> int:
+    """The run command"""
+    job = load_job(args.job)
+    if args.workers is not None:
+        job.workers = args.workers
+    if args.dry_run:
+        for task in job.tasks:
+            print(f"{task['name']:<24} {task['type']}")
+        return 0
+
+    start = time.perf_counter()
+    results = run_job(job, args.only, args.keep_going, report=_print_result)
+    failed = [result for result in results if result.status == "failed"]
+    print(f"{len(results) - len(failed)} of {len(results)} tasks done without error in {time.perf_counter() - start:.2f}s")
+    if args.summary:
+        from .utils.Instrumentation import instrumentation
+        print(instrumentation.summary())
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump([result.__dict__ for result in results], f, indent=2)
+    return 1 if failed else 0
+
+
+def _serve(args: argparse.Namespace) -> int:
+    """The serve command"""
+    import asyncio
+    from .service import serve
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_queued))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """The parser of the geo_app command line"""
+    parser = argparse.ArgumentParser(prog="geo_app", description="Merge and crop rasters and vector files for TUFLOW models")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the merge and crop tasks of a job file")
+    run.add_argument("job", help="the YAML, TOML or JSON job file")
+    run.add_argument("--workers", type=int, help="the size of the process pool shared by the crop tasks")
+    run.add_argument("--only", nargs="+", metavar="NAME", help="run only the named tasks")
+    run.add_argument("--keep-going", action="store_true", help="run the remaining tasks after one fails")
+    run.add_argument("--dry-run", action="store_true", help="check the job file and list its tasks")
+    run.add_argument("--summary", action="store_true", help="print the time, memory and I/O of every stage")
+    run.add_argument("--report", help="write the outcome and timing of every task to this JSON file")
+    run.set_defaults(handler=_run)
+
+    serve = commands.add_parser("serve", help="run a local job server that keeps the imports and caches warm between jobs")
+    serve.add_argument("--host", default="127.0.0.1", help="the address to listen on; keep it local, the server has no authentication")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--workers", type=int, default=2, help="the number of worker processes the jobs run on")
+    serve.add_argument("--max-queued", type=int, default=64, help="the number of waiting jobs beyond which new jobs are refused")
+    serve.set_defaults(handler=_serve)
+    return parser
+
+
+def main(argv: Optional[List[str]]=None) -> int:
+    """Entry point of python -m app"""
+    args = build_parser().parse_args(argv)
+    try:
+        return args.handler(args)
+    except (OSError, ValueError, ImportError) as error:
+        print(f"geo_app: error: {error}", file=sys.stderr)
+        return 2
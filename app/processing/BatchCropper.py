@@ -0,0 +1,196 @@
+#this script shall crop one raster file to every polygon of a layer in a single pass
+# neighbouring polygons are grouped so the source window they share is read only once
+
+import os
+import re
+import warnings
+import numpy as np
+import rasterio
+import shapely
+from rasterio.features import geometry_mask, geometry_window
+from rasterio.windows import Window, WindowError
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple, Union
+
+from .RasterCrop import fill_value
+from .RasterOutput import RasterOutput
+from .ShapeCropper import Cropper, GeoData
+from ..utils.GeometryCache import geometry_cache
+from ..utils.HandlePool import gdal_env
+from ..utils.Instrumentation import stage
+
+
+@dataclass
+class BatchRasterCropper(Cropper):
+    """Class for cropping a raster file to each polygon of the shapefile"""
+    geo_data: GeoData
+    # the attribute holding the name of each output file
+    name_field: str = "name"
+    # polygons whose bounding boxes are closer than this (in raster crs units) share one source read
+    group_distance: float = 0.0
+    # the largest shared window, in pixels, read for a group; bigger groups are cropped polygon by polygon
+    max_group_pixels: int = 16 * 1024 * 1024
+    # the number of processes cropping groups at the same time
+    workers: int = 1
+
+    def __post_init__(self):
+        if len(self.geo_data.raster_paths) != 1:
+            raise ValueError("Batch cropping needs exactly one raster file.")
+
+    def transform_crs(self):
+        """Take corrdinate reference system of the shapefile and transform it to that of the raster file"""
+        # read the shapefile transformed to the crs of the raster file, from the cache when it was done before;
+        # only its geometries and names are needed, so geopandas is not loaded where fiona reads them
+        shapefile_transformed = geometry_cache.layer(self.geo_data.shapefile_path, self.raster.crs)
+        if self.name_field not in shapefile_transformed.attributes:
+            raise ValueError(f"{self.name_field} is not a field of {self.geo_data.shapefile_path}.")
+        return shapefile_transformed
+
+    def groups(self) -> List[List[Tuple[str, shapely.Geometry]]]:
+        """Group the named polygons so neighbours are cropped from one shared read"""
+        shapefile_transformed = self.transform_crs()
+        geometries = shapefile_transformed.geometry
+        keep = ~(shapely.is_missing(geometries) | shapely.is_empty(geometries))
+        names = output_names(np.asarray(shapefile_transformed.attributes[self.name_field], dtype=object)[keep])
+        geometries = geometries[keep]
+        groups = []
+        for indices in group_by_proximity(geometries, self.group_distance):
+            group = [(names[i], geometries[i]) for i in indices]
+            # a group spanning too large a window is cropped polygon by polygon instead
+            if len(group) > 1 and _window_pixels(self.raster, [geometry for _, geometry in group]) > self.max_group_pixels:
+                groups.extend([feature] for feature in group)
+            else:
+                groups.append(group)
+        return groups
+
+    def crop(self) -> Iterator[Tuple[str, np.ndarray, rasterio.Affine]]:
+        """Crop the raster file to each polygon, yielding the name, the array and its transform"""
+        # the outside gets the same fill as the saved crops
+        fill, _ = fill_value(self.raster, self.geo_data.raster_output)
+        for group in self.groups():
+            yield from _crop_group(self.raster, group, fill)
+
+    def execute(self):
+        """Save one cropped raster file per polygon"""
+        groups = self.groups()
+        output = self.geo_data.raster_output
+        output_dir = self.geo_data.output_raster_path
+        cache_mb = self.geo_data.gdal_cache_mb
+        if self.workers <= 1:
+            for group in groups:
+                _write_group(self.geo_data.raster_path, group, output_dir, output, cache_mb)
+        else:
+            # each process opens its own handle on the raster
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(_write_group, self.geo_data.raster_path, group, output_dir, output, cache_mb)
+                           for group in groups]
+                for future in futures:
+                    future.result()
+        return None
+
+
+def output_names(values) -> List[str]:
+    """Turn attribute values into unique, file-system safe output names"""
+    names, seen = [], {}
+    for value in values:
+        name = re.sub(r"[^\w.-]+", "_", str(value)).strip("_") or "feature"
+        # repeated names get a numeric suffix
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+    return names
+
+
+def group_by_proximity(geometries: np.ndarray, distance: float) -> List[List[int]]:
+    """Group the geometries whose bounding boxes lie within distance of each other"""
+    tree = shapely.STRtree(geometries)
+    bounds = shapely.bounds(geometries) + np.array([-distance, -distance, distance, distance])
+    # pairs of (geometry, neighbour) whose expanded bounding boxes intersect
+    pairs = tree.query(shapely.box(bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3]))
+
+    # join the neighbours with a union-find
+    parent = list(range(len(geometries)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs.T:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups = {}
+    for i in range(len(geometries)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def _window_pixels(raster: rasterio.io.DatasetReader, geometries: List[shapely.Geometry]) -> int:
+    """Number of pixels in the raster window covering the geometries"""
+    try:
+        window = geometry_window(raster, geometries)
+    except WindowError:
+        return 0
+    return int(window.width) * int(window.height)
+
+
+def _crop_group(raster: rasterio.io.DatasetReader, group: List[Tuple[str, shapely.Geometry]],
+                fill: Union[int, float]) -> Iterator[Tuple[str, np.ndarray, rasterio.Affine]]:
+    """Read the window shared by a group once and crop each polygon out of it, filling the outside with fill"""
+    try:
+        group_window = _int_window(geometry_window(raster, [geometry for _, geometry in group]))
+    except WindowError:
+        warnings.warn(f"{', '.join(name for name, _ in group)} do not overlap {raster.name}; skipped.")
+        return
+    data = raster.read(window=group_window)
+
+    for name, geometry in group:
+        try:
+            window = _int_window(geometry_window(raster, [geometry]))
+        except WindowError:
+            warnings.warn(f"{name} does not overlap {raster.name}; skipped.")
+            continue
+        row_off = window.row_off - group_window.row_off
+        col_off = window.col_off - group_window.col_off
+        cropped = data[:, row_off:row_off + window.height, col_off:col_off + window.width].copy()
+        transform = raster.window_transform(window)
+        outside = geometry_mask([geometry], out_shape=cropped.shape[1:], transform=transform)
+        cropped[:, outside] = fill
+        yield name, cropped, transform
+
+
+def _write_group(raster_path: str, group: List[Tuple[str, shapely.Geometry]], output_dir: str, output: RasterOutput,
+                 gdal_cache_mb: Optional[int]=None) -> List[str]:
+    """Crop each polygon of a group and write one raster file per polygon"""
+    paths = []
+    # a worker process does not inherit the GDAL environment of the parent, so the cache limit is set here
+    with stage("crop_group", path=raster_path, polygons=len(group)), gdal_env(gdal_cache_mb), \
+            rasterio.open(raster_path) as raster:
+        # a raster without nodata gets one chosen for its dtype, unless a mask band marks the outside
+        fill, nodata = fill_value(raster, output)
+        geometries = dict(group)
+        for name, cropped, transform in _crop_group(raster, group, fill):
+            raster_meta = raster.meta.copy()
+            raster_meta.update({"driver": "GTiff",
+                                "height": cropped.shape[1],
+                                "width": cropped.shape[2],
+                                "transform": transform,
+                                "nodata": nodata})
+            path = os.path.join(output_dir, f"{name}.tif")
+            with output.open(path, raster_meta) as dst:
+                dst.write(cropped)
+                if output.mask_band:
+                    valid = ~geometry_mask([geometries[name]], out_shape=cropped.shape[1:], transform=transform)
+                    if raster.nodata is not None:
+                        valid &= np.any(cropped != raster.nodata, axis=0)
+                    dst.write_mask(valid)
+            paths.append(path)
+    return paths
+
+
+def _int_window(window: Window) -> Window:
+    """Window with integer offsets and lengths so it can be used to slice arrays"""
+    return Window(int(window.col_off), int(window.row_off), int(window.width), int(window.height))
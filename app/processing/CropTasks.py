@@ -0,0 +1,136 @@
+#this script shall describe single crops as tasks that can be run in another process
+# the reprojected clip geometry travels to the workers as WKB so it is reprojected once in the parent
+
+import os
+import hashlib
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional, Sequence, Union
+
+from .RasterOutput import RasterOutput
+from .VectorOutput import VectorOutput
+from ..utils.HandlePool import gdal_env
+from ..utils.Instrumentation import stage
+
+# the raster and vector stacks are imported by the tasks that use them, so a raster crop never loads the vector one
+
+
+def to_wkb(geometries: Sequence) -> List[bytes]:
+    """Serialise shapely geometries, e.g. those of a ClipLayer or a GeoSeries, to WKB"""
+    import numpy as np
+    import shapely
+    return list(shapely.to_wkb(np.asarray(geometries, dtype=object)))
+
+
+def _params(task) -> dict:
+    """Parameters of a task for the build cache, with the clip geometry reduced to a hash"""
+    params = asdict(task)
+    # how the work is scheduled and cached does not change the output
+    for name in ("scheduler", "workers", "gdal_cache_mb"):
+        params.pop(name, None)
+    params["clip_wkb"] = hashlib.sha256(b"".join(task.clip_wkb)).hexdigest()
+    params["task"] = type(task).__name__
+    return params
+
+
+@dataclass
+class RasterCropTask:
+    """Class to hold the crop of one raster file"""
+    raster_path: str
+    # the clip geometries in the crs of the raster, as WKB
+    clip_wkb: List[bytes]
+    output_file: str
+    output: RasterOutput = field(default_factory=RasterOutput)
+    engine: str = "mask"
+    block_size: int = 512
+    # the dask scheduler and its number of workers, used by the dask engine
+    scheduler: str = "threads"
+    workers: int = 1
+    # the GDAL block cache of the process running the task, in megabytes; None keeps the GDAL default
+    gdal_cache_mb: Optional[int] = None
+
+    def run(self) -> str:
+        """Crop the raster file and return the path of the output"""
+        import rasterio
+        import shapely
+        from .RasterCrop import write_cropped_raster
+
+        shapes = shapely.from_wkb(self.clip_wkb)
+        # the task may run in a worker process, which does not inherit the GDAL environment of the parent
+        with gdal_env(self.gdal_cache_mb), rasterio.open(self.raster_path) as raster:
+            write_cropped_raster(raster, shapes, self.output_file, self.output, self.engine, self.block_size,
+                                 self.scheduler, self.workers)
+        return self.output_file
+
+    def inputs(self) -> List[str]:
+        """The files the task reads"""
+        return [self.raster_path]
+
+    def outputs(self) -> List[str]:
+        """The files the task writes"""
+        return [self.output_file]
+
+    def params(self) -> dict:
+        """Everything else the output depends on"""
+        return _params(self)
+
+
+@dataclass
+class VectorCropTask:
+    """Class to hold the crop of one vector file"""
+    vector_path: str
+    # the clip geometries in the crs of the vector file, as WKB, with that crs as wkt
+    clip_wkb: List[bytes]
+    crs: str
+    output_dir: str
+    name: str = "vector_cropped"
+    # the attributes of the clip polygons, joined by the overlay engine
+    clip_attributes: dict = field(default_factory=dict)
+    output: VectorOutput = field(default_factory=VectorOutput)
+    engine: str = "overlay"
+    pushdown: str = "mask"
+    # the GDAL block cache of the process running the task, in megabytes; None keeps the GDAL default
+    gdal_cache_mb: Optional[int] = None
+
+    def run(self) -> str:
+        """Crop the vector file and return the path of the output"""
+        import geopandas as gpd
+        from .VectorClip import clip_vector, read_vector, set_gdal_cache
+
+        set_gdal_cache(self.gdal_cache_mb)
+        clip = gpd.GeoDataFrame(self.clip_attributes, geometry=gpd.GeoSeries.from_wkb(self.clip_wkb, crs=self.crs))
+        with stage("read_vector", path=self.vector_path, pushdown=self.pushdown) as record:
+            vector = read_vector(self.vector_path, clip, self.pushdown)
+            record["features"] = len(vector)
+        with stage("clip_vector", engine=self.engine):
+            vector_cropped = clip_vector(vector, clip, self.engine)
+        with stage("write_vector", format=self.output.format, features=len(vector_cropped)):
+            return self.output.write(vector_cropped, self.output_dir, self.name)
+
+    def inputs(self) -> List[str]:
+        """The files the task reads"""
+        return [self.vector_path]
+
+    def outputs(self) -> List[str]:
+        """The files the task writes"""
+        return [os.path.join(self.output_dir, self.name + self.output.suffix)]
+
+    def params(self) -> dict:
+        """Everything else the output depends on"""
+        return _params(self)
+
+
+def run_tasks(tasks: Sequence[Union[RasterCropTask, VectorCropTask]], workers: int=1,
+              executor: Optional[Executor]=None) -> List[str]:
+    """Run the tasks, in a process pool when workers > 1, and return their outputs in order
+
+    executor is a pool shared across calls; when given it runs the tasks whatever workers is.
+    """
+    if executor is not None and len(tasks) > 1:
+        futures = [executor.submit(task.run) for task in tasks]
+        return [future.result() for future in futures]
+    if workers <= 1 or len(tasks) <= 1:
+        return [task.run() for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        futures = [executor.submit(task.run) for task in tasks]
+        return [future.result() for future in futures]
@@ -0,0 +1,133 @@
+#this script shall build rasters as lazy chunks of dask delayed blocks and write them to disk a few chunks at a time
+# every chunk is one block of the output, so a raster many times larger than memory is only ever held a few
+# blocks at a time, and the chunks run on one thread pool, one process pool or in the calling process
+
+import importlib.util
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+# dask is optional; only the dask merge mode and crop engine need it, so it and rasterio are imported there
+if TYPE_CHECKING:
+    import numpy as np
+    from dask.delayed import Delayed
+    from rasterio.io import DatasetWriter
+    from rasterio.windows import Window
+
+
+# the local dask schedulers the chunks can be computed on
+SCHEDULERS = ("threads", "processes", "synchronous")
+
+
+def require_dask(scheduler: str) -> None:
+    """Check dask is installed and the scheduler is known"""
+    if importlib.util.find_spec("dask") is None:
+        raise ImportError("The dask backend needs dask; install it with `pip install dask`.")
+    if scheduler not in SCHEDULERS:
+        raise ValueError(f"scheduler should be one of {', '.join(SCHEDULERS)}.")
+    return None
+
+
+def chunk_windows(height: int, width: int, block_size: int) -> List[List["Window"]]:
+    """The windows of the chunks of a height by width grid, row by row"""
+    from rasterio.windows import Window
+    return [[Window(col, row, min(block_size, width - col), min(block_size, height - row))
+             for col in range(0, width, block_size)]
+            for row in range(0, height, block_size)]
+
+
+def lazy_array(grid: List[List["Window"]], count: int, dtype: str, block: Callable[..., "np.ndarray"],
+               inputs: Optional[Callable[["Window"], tuple]]=None, with_mask: bool=False) -> "LazyRaster":
+    """Build a lazy (count, height, width) raster whose chunks are computed by block(window, *inputs(window))
+
+    inputs is evaluated while the chunks are built, so each chunk only carries what it needs
+    (e.g. the tiles under it). block must be picklable (a module-level function or a
+    functools.partial of one) for the process scheduler. With with_mask, block returns a
+    (data, mask) pair whose mask is a uint8 (height, width) array.
+    """
+    import dask
+
+    inputs = inputs or (lambda window: ())
+    chunks = [[dask.delayed(block, pure=True)(window, *inputs(window)) for window in row] for row in grid]
+    return LazyRaster(grid, chunks, count, dtype, with_mask)
+
+
+@dataclass
+class LazyRaster:
+    """Class to hold the delayed chunks of a raster, one per window of its grid"""
+    # the windows of the chunks, row by row
+    grid: List[List["Window"]]
+    # one delayed block call per window; each graph holds only its own call, so a chunk is computed without culling
+    chunks: List[List["Delayed"]]
+    count: int
+    dtype: str
+    # whether each chunk returns a (data, mask) pair
+    with_mask: bool = False
+
+    def to_array(self):
+        """The raster as a dask array, and its mask as a second array with with_mask"""
+        import dask.array as da
+
+        data, masks = [], []
+        for windows, chunks in zip(self.grid, self.chunks):
+            data_row, mask_row = [], []
+            for window, chunk in zip(windows, chunks):
+                shape = (int(window.height), int(window.width))
+                if self.with_mask:
+                    # both halves come from the one delayed call, so it runs once when they are computed together
+                    data_row.append(da.from_delayed(chunk[0], shape=(self.count,) + shape, dtype=self.dtype))
+                    mask_row.append(da.from_delayed(chunk[1], shape=shape, dtype="uint8"))
+                else:
+                    data_row.append(da.from_delayed(chunk, shape=(self.count,) + shape, dtype=self.dtype))
+            data.append(data_row)
+            masks.append(mask_row)
+        array = da.block([data])
+        return (array, da.block(masks)) if self.with_mask else array
+
+
+def write_array(raster: LazyRaster, dst: "DatasetWriter", scheduler: str="threads", workers: int=1) -> None:
+    """Compute the chunks of the raster on one pool and write each to its window of the output as it arrives
+
+    The pool lives for the whole write, so the process scheduler starts its workers (and
+    imports rasterio in them) once rather than per chunk. At most twice as many chunks as
+    there are workers are in flight, which keeps the workers busy while earlier chunks are
+    written and bounds memory. With raster.with_mask the mask of each chunk goes to the mask band.
+    """
+    if scheduler == "synchronous":
+        executor = nullcontext()
+    elif scheduler == "processes":
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    with executor:
+        for windows, chunks in zip(raster.grid, raster.chunks):
+            for window, chunk in zip(windows, chunks):
+                if scheduler == "synchronous":
+                    _write_chunk(dst, window, _compute_chunk(chunk), raster.with_mask)
+                    continue
+                pending.append((window, executor.submit(_compute_chunk, chunk)))
+                if len(pending) >= 2 * workers:
+                    window, future = pending.popleft()
+                    _write_chunk(dst, window, future.result(), raster.with_mask)
+        while pending:
+            window, future = pending.popleft()
+            _write_chunk(dst, window, future.result(), raster.with_mask)
+    return None
+
+
+def _compute_chunk(chunk: "Delayed"):
+    """Compute a chunk in the calling process"""
+    return chunk.compute(scheduler="synchronous")
+
+
+def _write_chunk(dst: "DatasetWriter", window: "Window", result, with_mask: bool) -> None:
+    """Write a computed chunk, and its mask when it has one, to its window"""
+    if with_mask:
+        dst.write(result[0], window=window)
+        dst.write_mask(result[1], window=window)
+    else:
+        dst.write(result, window=window)
+    return None
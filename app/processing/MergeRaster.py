@@ -1,30 +1,507 @@
 #this script shall merge the raster files into a single raster using rasterio library
 
 import os
+import json
+import xml.etree.ElementTree as ET
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
 import rasterio
+from rasterio import windows
+from rasterio.enums import Resampling
 from rasterio.merge import merge
-from typing import List, Optional
+from rasterio.transform import Affine
+from shapely import STRtree, box
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+from .DaskBackend import chunk_windows, lazy_array, require_dask, write_array
+from .RasterOutput import RasterOutput
+from ..utils.HandlePool import DatasetPool, gdal_env
+from ..utils.Instrumentation import stage
+from ..utils.Profiling import Profiler
+from ..utils.TileIndex import TileIndex, TileInfo
+
+
+# how overlapping tiles are combined; "priority" is "first" after ordering the tiles by their priority
+MERGE_METHODS = ("first", "last", "min", "max", "mean", "priority")
+
 
 # merege the raster file given a list of directory paths of raster files
-def merge_raster(raster_paths: List[str], output_path: Optional[str]=None) -> None:
-    """Merge the raster files into a single raster file"""
-    # open the raster files
-    raster_files = [rasterio.open(path) for path in raster_paths]
-    # merge the raster files
-    raster_merged, raster_transform = merge(raster_files)
-    # get the metadata of the raster file
-    raster_meta = raster_files[0].meta.copy()
+def merge_raster(raster_paths: List[str], output_path: Optional[str]=None, mode: str="memory", block_size: int=512,
+                 index_path: Optional[str]=None, workers: int=1, output: Optional[RasterOutput]=None,
+                 max_open: int=64, gdal_cache_mb: Optional[int]=None, incremental: bool=False,
+                 res: Optional[Union[float, Tuple[float, float]]]=None, method: str="first", resampling: str="nearest",
+                 priority: Optional[Sequence]=None, scheduler: str="threads", profiler: Optional[Profiler]=None) -> None:
+    """Merge the raster files into a single raster file
+
+    mode "memory" merges every tile in one go with rasterio; mode "stream" fills the
+    output block by block so only the tiles intersecting a block are ever read;
+    mode "vrt" writes a GDAL virtual raster that references the tiles without copying pixels;
+    mode "dask" builds the mosaic as a lazy chunked dask array, one chunk per output block,
+    and computes it on the local scheduler ("threads", "processes" or "synchronous").
+    index_path is an optional sidecar file where the tile footprints are kept between runs.
+    workers > 1 merges the blocks of the streaming mode in a process pool, or sets the number
+    of dask workers.
+    output sets the compression and COG layout of the GTiff modes.
+    max_open bounds the tile handles each process of the streaming mode keeps open and
+    gdal_cache_mb bounds the GDAL block cache of each process.
+    incremental keeps a manifest of the tiles next to the output of the streaming mode and, on
+    the next run, only rewrites the blocks under tiles that were added, changed or removed.
+    res is the target cell size (defaults to that of the first tile) and resampling the GDAL
+    resampling used when a tile is read at another resolution.
+    method combines overlapping tiles: first, last, min, max, mean, or priority, where the tile
+    with the highest priority value (e.g. the survey date) wins; priority has one value per tile.
+    profiler, when given, profiles the merge and writes its reports to a profiles directory
+    next to the output.
+    """
+    if not raster_paths:
+        raise ValueError("At least one raster file should be given.")
+    if workers < 1:
+        raise ValueError("workers should be at least 1.")
+    if workers > 1 and mode not in ("stream", "dask"):
+        raise ValueError("workers > 1 is only supported with mode='stream' or mode='dask'.")
+    if mode == "dask":
+        require_dask(scheduler)
+    if output is None:
+        output = RasterOutput()
+    if mode == "vrt" and (output.cog or output.compress):
+        raise ValueError("A VRT output cannot be compressed or cloud-optimised.")
+    if incremental and (mode != "stream" or output.cog):
+        raise ValueError("incremental is only supported with mode='stream' and a non-COG output.")
+    if method not in MERGE_METHODS:
+        raise ValueError(f"method should be one of {', '.join(MERGE_METHODS)}.")
+    if resampling not in Resampling.__members__:
+        raise ValueError(f"Unknown resampling: {resampling}")
+    if mode == "vrt" and method not in ("first", "last", "priority"):
+        raise ValueError("A VRT output only supports the first, last and priority methods.")
+    if isinstance(res, (int, float)):
+        res = (float(res), float(res))
+    # the priority method is the first method over the tiles sorted by descending priority
+    if method == "priority":
+        if priority is None or len(priority) != len(raster_paths):
+            raise ValueError("priority should give one value per raster file.")
+        raster_paths = [path for _, path in sorted(zip(priority, raster_paths), key=lambda pair: pair[0], reverse=True)]
+        method = "first"
+    # if the output path is not given, save the raster file in the same directory as the first raster file
+    if output_path is None:
+        output_name = "raster_merged.vrt" if mode == "vrt" else "raster_merged.tif"
+        output_path = os.path.join(os.path.dirname(raster_paths[0]), output_name)
+
+    profiling = profiler.profile("merge_raster", os.path.dirname(os.path.abspath(output_path))) if profiler else nullcontext()
+    with profiling, stage("merge_raster", mode=mode, tiles=len(raster_paths), output=output_path), gdal_env(gdal_cache_mb):
+        if mode == "memory":
+            _merge_in_memory(raster_paths, output_path, output, res, method, resampling, max_open)
+        elif mode == "stream":
+            _merge_streaming(raster_paths, output_path, block_size, index_path, workers, output, max_open, gdal_cache_mb,
+                             incremental, res, method, resampling)
+        elif mode == "vrt":
+            _merge_vrt(raster_paths, output_path, index_path, res, method, resampling)
+        elif mode == "dask":
+            _merge_dask(raster_paths, output_path, block_size, index_path, workers, output, max_open, gdal_cache_mb,
+                        res, method, resampling, scheduler)
+        else:
+            raise ValueError(f"Unknown merge mode: {mode}")
+    return None
+
+
+def _merge_in_memory(raster_paths: List[str], output_path: str, output: RasterOutput, res: Optional[Tuple[float, float]],
+                     method: str, resampling: str, max_open: int) -> None:
+    """Merge the raster files by holding the whole mosaic in memory"""
+    if method == "mean":
+        # rasterio has no mean, so the block compositor merges the whole grid as a single block
+        index = TileIndex.from_paths(raster_paths)
+        raster_meta = _output_meta(index, res)
+        with DatasetPool(max_open) as pool:
+            raster_merged = _merge_block(index.tiles, windows.Window(0, 0, raster_meta["width"], raster_meta["height"]),
+                                         raster_meta, pool, method, resampling)
+        with output.open(output_path, raster_meta) as dst:
+            dst.write(raster_merged)
+        return None
+
+    with stage("merge_tiles"):
+        # given paths, rasterio opens each raster file only while it reads it, so a large catalogue
+        # never holds more than one handle at a time
+        raster_merged, raster_transform = merge(raster_paths, res=res, method=method, resampling=Resampling[resampling])
+        # get the metadata of the first raster file
+        with rasterio.open(raster_paths[0]) as raster_file:
+            raster_meta = raster_file.meta.copy()
     # update the metadata
     raster_meta.update({"driver": "GTiff",
                         "height": raster_merged.shape[1],
                         "width": raster_merged.shape[2],
                         "transform": raster_transform})
 
-    # if the output path is not given, save the raster file in the same directory as the first raster file
-    if output_path is None:
-        output_path = os.path.join(os.path.dirname(raster_paths[0]), "raster_merged.tif")
-        
     # write the raster file
-    with rasterio.open(output_path, "w", **raster_meta) as dst:
+    with stage("write_raster"), output.open(output_path, raster_meta) as dst:
         dst.write(raster_merged)
-    return None
\ No newline at end of file
+    return None
+
+
+def _merge_streaming(raster_paths: List[str], output_path: str, block_size: int, index_path: Optional[str],
+                     workers: int, output: RasterOutput, max_open: int, gdal_cache_mb: Optional[int],
+                     incremental: bool, res: Optional[Tuple[float, float]], method: str, resampling: str) -> None:
+    """Merge the raster files block by block without materialising the whole mosaic"""
+    if block_size <= 0 or block_size % 16 != 0:
+        raise ValueError("block_size should be a positive multiple of 16.")
+
+    # index the tile footprints from their headers only; no pixels are read at this point
+    with stage("tile_index"):
+        index = TileIndex.from_paths(raster_paths, index_path)
+    # compute the output grid from the tile metadata
+    raster_meta = _output_meta(index, res)
+    raster_meta.update({"tiled": True,
+                        "blockxsize": block_size,
+                        "blockysize": block_size})
+
+    manifest_path = output_path + ".manifest.json"
+    settings = {"method": method, "resampling": resampling}
+    dirty = _dirty_footprints(manifest_path, output_path, index, raster_meta, settings) if incremental else None
+    if dirty is not None:
+        # only the blocks under the added, changed or removed tiles are merged again
+        dirty_tree = STRtree([box(*bounds) for bounds in dirty])
+        with rasterio.open(output_path, "r+") as dst:
+            _fill_blocks(dst, index, raster_meta, workers, max_open, gdal_cache_mb, method, resampling,
+                         keep=lambda bounds: len(dirty_tree.query(box(*bounds))) > 0)
+    else:
+        # fill the output one tiled block at a time
+        with output.open(output_path, raster_meta) as dst:
+            _fill_blocks(dst, index, raster_meta, workers, max_open, gdal_cache_mb, method, resampling)
+
+    if incremental:
+        _write_manifest(manifest_path, index, raster_meta, settings)
+    return None
+
+
+def _fill_blocks(dst: rasterio.io.DatasetWriter, index: TileIndex, raster_meta: dict, workers: int, max_open: int,
+                 gdal_cache_mb: Optional[int], method: str, resampling: str, keep=None) -> None:
+    """Merge and write the blocks of the output, or only those whose bounds pass keep"""
+    jobs = _block_jobs(dst, index, raster_meta, keep)
+    with stage("merge_blocks", workers=workers, incremental=keep is not None):
+        if workers == 1:
+            # the tiles are opened lazily and at most max_open stay open at once
+            with DatasetPool(max_open) as pool:
+                for tiles, window in jobs:
+                    dst.write(_merge_block(tiles, window, raster_meta, pool, method, resampling), window=window)
+        else:
+            # each worker process keeps its own pool of tile handles
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(max_open, gdal_cache_mb)) as executor:
+                # blocks are independent so they can be merged anywhere, but they are written in order
+                for window, block in _map_blocks(executor, jobs, raster_meta, method, resampling, max_pending=2 * workers):
+                    dst.write(block, window=window)
+    return None
+
+
+def _block_jobs(dst: rasterio.io.DatasetWriter, index: TileIndex, raster_meta: dict, keep=None) -> Iterator[Tuple[List[TileInfo], windows.Window]]:
+    """Yield the output blocks to merge with the tiles that intersect them"""
+    for _, window in dst.block_windows(1):
+        bounds = windows.bounds(window, raster_meta["transform"])
+        if keep is None or keep(bounds):
+            # only the tiles whose footprint intersects a block are opened for it
+            yield index.query(bounds), window
+
+
+def _grid(raster_meta: dict, settings: dict) -> str:
+    """The output grid and compositing settings as a canonical string so two runs can be compared"""
+    return json.dumps({**settings,
+                       "transform": list(raster_meta["transform"])[:6],
+                       "width": raster_meta["width"],
+                       "height": raster_meta["height"],
+                       "count": raster_meta["count"],
+                       "dtype": raster_meta["dtype"],
+                       "nodata": raster_meta["nodata"],
+                       "crs": raster_meta["crs"],
+                       "block_size": raster_meta["blockxsize"]}, sort_keys=True)
+
+
+def _write_manifest(manifest_path: str, index: TileIndex, raster_meta: dict, settings: dict) -> None:
+    """Record the output grid and the fingerprint and footprint of every tile"""
+    manifest = {"grid": _grid(raster_meta, settings),
+                "tiles": [{"path": tile.path, "size": tile.size, "mtime_ns": tile.mtime_ns, "bounds": list(tile.bounds)}
+                          for tile in index.tiles]}
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    return None
+
+
+def _dirty_footprints(manifest_path: str, output_path: str, index: TileIndex, raster_meta: dict,
+                      settings: dict) -> Optional[List[Tuple[float, float, float, float]]]:
+    """Footprints of the tiles that changed since the manifest was written, or None when a full merge is needed"""
+    if not (os.path.exists(manifest_path) and os.path.exists(output_path)):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    # a different grid or compositing means every block changed
+    if manifest["grid"] != _grid(raster_meta, settings):
+        return None
+
+    old = {tile["path"]: tile for tile in manifest["tiles"]}
+    new = {tile.path: tile for tile in index.tiles}
+    # the first tile wins on overlaps, so reordering the tiles that were kept changes the output too
+    if [path for path in old if path in new] != [path for path in new if path in old]:
+        return None
+
+    dirty = []
+    for path, tile in old.items():
+        fingerprint = (tile["size"], tile["mtime_ns"], tuple(tile["bounds"]))
+        if path not in new or fingerprint != (new[path].size, new[path].mtime_ns, new[path].bounds):
+            # the blocks a removed or changed tile used to cover
+            dirty.append(tuple(tile["bounds"]))
+            if path in new:
+                dirty.append(new[path].bounds)
+    # the blocks an added tile covers
+    dirty.extend(tile.bounds for path, tile in new.items() if path not in old)
+    return dirty
+
+
+def _map_blocks(executor: ProcessPoolExecutor, jobs: Iterator[Tuple[List[TileInfo], windows.Window]], raster_meta: dict,
+                method: str, resampling: str, max_pending: int) -> Iterator[Tuple[windows.Window, np.ndarray]]:
+    """Merge the blocks in the executor and yield them in submission order, keeping at most max_pending in flight"""
+    pending = deque()
+    for tiles, window in jobs:
+        pending.append((window, executor.submit(_merge_block_in_worker, tiles, window, raster_meta, method, resampling)))
+        if len(pending) >= max_pending:
+            window, future = pending.popleft()
+            yield window, future.result()
+    while pending:
+        window, future = pending.popleft()
+        yield window, future.result()
+
+
+# the tile handles and GDAL environment of a merge worker process
+_worker_pool: Optional[DatasetPool] = None
+_worker_env: Optional[rasterio.Env] = None
+
+
+def _init_worker(max_open: int, gdal_cache_mb: Optional[int]) -> None:
+    """Set up the tile handle pool and GDAL environment of a merge worker process"""
+    global _worker_pool, _worker_env
+    _worker_pool = DatasetPool(max_open)
+    # the environment stays active for the life of the worker
+    _worker_env = gdal_env(gdal_cache_mb)
+    _worker_env.__enter__()
+    return None
+
+
+def _merge_block_in_worker(tiles: List[TileInfo], window: windows.Window, raster_meta: dict, method: str,
+                           resampling: str) -> np.ndarray:
+    """Merge a block with the tile handles of the worker process"""
+    return _merge_block(tiles, window, raster_meta, _worker_pool, method, resampling)
+
+
+def _merge_dask(raster_paths: List[str], output_path: str, block_size: int, index_path: Optional[str], workers: int,
+                output: RasterOutput, max_open: int, gdal_cache_mb: Optional[int], res: Optional[Tuple[float, float]],
+                method: str, resampling: str, scheduler: str) -> None:
+    """Merge the raster files as a lazy dask raster computed and written a few blocks at a time"""
+    if block_size <= 0 or block_size % 16 != 0:
+        raise ValueError("block_size should be a positive multiple of 16.")
+
+    with stage("tile_index"):
+        index = TileIndex.from_paths(raster_paths, index_path)
+    raster_meta = _output_meta(index, res)
+    raster_meta.update({"tiled": True,
+                        "blockxsize": block_size,
+                        "blockysize": block_size})
+    # the chunks line up with the tiled blocks of the output so every write covers whole blocks
+    grid = chunk_windows(raster_meta["height"], raster_meta["width"], block_size)
+    mosaic = lazy_array(grid, raster_meta["count"], raster_meta["dtype"],
+                        partial(_merge_chunk, raster_meta, method, resampling, max_open, gdal_cache_mb),
+                        inputs=lambda window: (index.query(windows.bounds(window, raster_meta["transform"])),))
+    with stage("merge_blocks", workers=workers, scheduler=scheduler), output.open(output_path, raster_meta) as dst:
+        write_array(mosaic, dst, scheduler, workers)
+    return None
+
+
+def _merge_chunk(raster_meta: dict, method: str, resampling: str, max_open: int, gdal_cache_mb: Optional[int],
+                 window: windows.Window, tiles: List[TileInfo]) -> np.ndarray:
+    """Merge one chunk of the dask mosaic with its own tile handles, so it runs on any scheduler"""
+    with gdal_env(gdal_cache_mb), DatasetPool(max_open) as pool:
+        return _merge_block(tiles, window, raster_meta, pool, method, resampling)
+
+
+def _merge_vrt(raster_paths: List[str], output_path: str, index_path: Optional[str], res: Optional[Tuple[float, float]],
+               method: str, resampling: str) -> None:
+    """Write a VRT mosaic that references the tiles in place"""
+    index = TileIndex.from_paths(raster_paths, index_path)
+    # a VRT cannot reproject or change the band layout of its sources
+    first = index.tiles[0]
+    for tile in index.tiles:
+        if (tile.crs, tile.count, tile.dtype) != (first.crs, first.count, first.dtype):
+            raise ValueError(f"{tile.path} does not share the crs, band count and dtype of {first.path}.")
+        if res is None and tile.res != first.res:
+            raise ValueError(f"{tile.path} does not share the resolution of {first.path}; give res to resample.")
+
+    raster_meta = _output_meta(index, res)
+    xres, yres = raster_meta["transform"].a, -raster_meta["transform"].e
+    left, top = raster_meta["transform"].c, raster_meta["transform"].f
+
+    vrt = ET.Element("VRTDataset", rasterXSize=str(raster_meta["width"]), rasterYSize=str(raster_meta["height"]))
+    if first.crs:
+        # no dataAxisToSRSAxisMapping: GDAL then maps the geotransform in traditional GIS (easting, northing)
+        # order, which is what it means for CRSs whose authority order is northing first, e.g. EPSG:2193 or EPSG:4326
+        ET.SubElement(vrt, "SRS").text = first.crs
+    ET.SubElement(vrt, "GeoTransform").text = ", ".join(repr(v) for v in raster_meta["transform"].to_gdal())
+    for band in range(1, first.count + 1):
+        vrt_band = ET.SubElement(vrt, "VRTRasterBand", dataType=_GDAL_DTYPES[first.dtype], band=str(band))
+        if first.nodata is not None:
+            ET.SubElement(vrt_band, "NoDataValue").text = repr(first.nodata)
+        # GDAL paints the sources in order so later ones win; reverse them to keep the first tile on top like the other modes
+        for tile in (reversed(index.tiles) if method == "first" else index.tiles):
+            tile_width = int(round((tile.bounds[2] - tile.bounds[0]) / tile.res[0]))
+            tile_height = int(round((tile.bounds[3] - tile.bounds[1]) / tile.res[1]))
+            # nodata pixels of a tile must not cover the tiles underneath
+            source = ET.SubElement(vrt_band, "ComplexSource" if tile.nodata is not None else "SimpleSource")
+            if tile.res != (xres, yres):
+                source.set("resampling", resampling)
+            filename, relative = _vrt_source_path(tile.path, output_path)
+            ET.SubElement(source, "SourceFilename", relativeToVRT=relative).text = filename
+            ET.SubElement(source, "SourceBand").text = str(band)
+            ET.SubElement(source, "SourceProperties", RasterXSize=str(tile_width), RasterYSize=str(tile_height),
+                          DataType=_GDAL_DTYPES[tile.dtype])
+            ET.SubElement(source, "SrcRect", xOff="0", yOff="0", xSize=str(tile_width), ySize=str(tile_height))
+            ET.SubElement(source, "DstRect", xOff=repr((tile.bounds[0] - left) / xres), yOff=repr((top - tile.bounds[3]) / yres),
+                          xSize=repr((tile.bounds[2] - tile.bounds[0]) / xres), ySize=repr((tile.bounds[3] - tile.bounds[1]) / yres))
+            if tile.nodata is not None:
+                ET.SubElement(source, "NODATA").text = repr(tile.nodata)
+
+    ET.indent(vrt)
+    ET.ElementTree(vrt).write(output_path, encoding="utf-8")
+    return None
+
+
+def _vrt_source_path(tile_path: str, output_path: str) -> Tuple[str, str]:
+    """Return the path of a tile as seen from the VRT and whether it is relative"""
+    try:
+        return os.path.relpath(tile_path, os.path.dirname(os.path.abspath(output_path))), "1"
+    except ValueError:
+        # the tile lives on another drive so it cannot be relative to the VRT
+        return os.path.abspath(tile_path), "0"
+
+
+# the GDAL names of the numpy dtypes rasterio uses
+_GDAL_DTYPES = {"uint8": "Byte",
+                "int8": "Int8",
+                "uint16": "UInt16",
+                "int16": "Int16",
+                "uint32": "UInt32",
+                "int32": "Int32",
+                "uint64": "UInt64",
+                "int64": "Int64",
+                "float32": "Float32",
+                "float64": "Float64",
+                "complex64": "CFloat32",
+                "complex128": "CFloat64"}
+
+
+def _output_meta(index: TileIndex, res: Optional[Tuple[float, float]]=None) -> dict:
+    """Compute the metadata of the output grid from the union of the tile bounds"""
+    # the first tile sets the resolution, dtype, band count and nodata like rasterio.merge does
+    first = index.tiles[0]
+    left, bottom, right, top = index.bounds
+    xres, yres = res or first.res
+    return {"driver": "GTiff",
+            "dtype": first.dtype,
+            "count": first.count,
+            "crs": first.crs,
+            "nodata": first.nodata,
+            "width": max(1, int(round((right - left) / xres))),
+            "height": max(1, int(round((top - bottom) / yres))),
+            "transform": Affine.translation(left, top) * Affine.scale(xres, -yres)}
+
+
+def _merge_block(tiles: List[TileInfo], window: windows.Window, raster_meta: dict, pool: DatasetPool,
+                 method: str="first", resampling: str="nearest") -> np.ndarray:
+    """Merge the tiles that intersect a single output window"""
+    height, width = int(window.height), int(window.width)
+    nodata = raster_meta["nodata"]
+    # start from an empty block; pixels are filled as the method decides
+    block = np.full((raster_meta["count"], height, width), nodata if nodata is not None else 0, dtype=raster_meta["dtype"])
+    empty = np.ones(block.shape, dtype=bool)
+    if method == "mean":
+        total = np.zeros(block.shape, dtype="float64")
+        count = np.zeros(block.shape, dtype="uint32")
+
+    block_transform = windows.transform(window, raster_meta["transform"])
+    left, bottom, right, top = windows.bounds(window, raster_meta["transform"])
+    for tile in tiles:
+        # skip the tiles that do not intersect the block
+        int_left, int_bottom = max(left, tile.bounds[0]), max(bottom, tile.bounds[1])
+        int_right, int_top = min(right, tile.bounds[2]), min(top, tile.bounds[3])
+        if int_left >= int_right or int_bottom >= int_top:
+            continue
+
+        # locate the intersection inside the block
+        dst_window = windows.from_bounds(int_left, int_bottom, int_right, int_top, block_transform)
+        row_off, col_off = max(0, int(round(dst_window.row_off))), max(0, int(round(dst_window.col_off)))
+        rows = min(int(round(dst_window.height)), height - row_off)
+        cols = min(int(round(dst_window.width)), width - col_off)
+        if rows <= 0 or cols <= 0:
+            continue
+
+        # read only the part of the tile that falls inside the block, resampled by GDAL straight to the output cell size
+        src = pool.get(tile.path)
+        src_window = windows.from_bounds(int_left, int_bottom, int_right, int_top, src.transform)
+        tile_data = src.read(out_shape=(raster_meta["count"], rows, cols), window=src_window, masked=True,
+                             resampling=Resampling[resampling])
+
+        region = (slice(None), slice(row_off, row_off + rows), slice(col_off, col_off + cols))
+        if method == "mean":
+            valid = ~np.ma.getmaskarray(tile_data)
+            total[region] += np.where(valid, np.ma.getdata(tile_data), 0)
+            count[region] += valid
+            continue
+        _COMPOSITE[method](block[region], empty[region], tile_data)
+
+        # the first tile to fill a pixel keeps it, so stop once every pixel of the block has been filled
+        if method == "first" and not empty.any():
+            break
+
+    if method == "mean":
+        filled = count > 0
+        mean = total / np.maximum(count, 1)
+        if np.issubdtype(block.dtype, np.integer):
+            mean = np.rint(mean)
+        np.copyto(block, mean, where=filled, casting="unsafe")
+    return block
+
+
+def _copy_first(region: np.ndarray, region_empty: np.ndarray, tile_data: np.ma.MaskedArray) -> None:
+    """Fill the empty pixels of the region with the valid pixels of the tile"""
+    fill = region_empty & ~np.ma.getmaskarray(tile_data)
+    np.copyto(region, np.ma.getdata(tile_data), where=fill, casting="unsafe")
+    region_empty &= ~fill
+    return None
+
+
+def _copy_last(region: np.ndarray, region_empty: np.ndarray, tile_data: np.ma.MaskedArray) -> None:
+    """Overwrite the region with every valid pixel of the tile"""
+    valid = ~np.ma.getmaskarray(tile_data)
+    np.copyto(region, np.ma.getdata(tile_data), where=valid, casting="unsafe")
+    region_empty &= ~valid
+    return None
+
+
+def _copy_min(region: np.ndarray, region_empty: np.ndarray, tile_data: np.ma.MaskedArray) -> None:
+    """Keep the lowest valid value of the region and the tile"""
+    data = np.ma.getdata(tile_data)
+    valid = ~np.ma.getmaskarray(tile_data)
+    np.copyto(region, data, where=valid & (region_empty | (data < region)), casting="unsafe")
+    region_empty &= ~valid
+    return None
+
+
+def _copy_max(region: np.ndarray, region_empty: np.ndarray, tile_data: np.ma.MaskedArray) -> None:
+    """Keep the highest valid value of the region and the tile"""
+    data = np.ma.getdata(tile_data)
+    valid = ~np.ma.getmaskarray(tile_data)
+    np.copyto(region, data, where=valid & (region_empty | (data > region)), casting="unsafe")
+    region_empty &= ~valid
+    return None
+
+
+# the compositing of a tile into a block by method; mean accumulates sums and counts instead
+_COMPOSITE = {"first": _copy_first,
+              "last": _copy_last,
+              "min": _copy_min,
+              "max": _copy_max}
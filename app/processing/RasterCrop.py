@@ -0,0 +1,212 @@
+#this script shall crop a raster file to a set of polygons and write the result to disk
+
+import numpy as np
+import rasterio
+import shapely
+from functools import partial
+from rasterio.features import geometry_mask, geometry_window
+from rasterio.io import DatasetReader
+from rasterio.mask import raster_geometry_mask
+from rasterio.transform import Affine
+from rasterio.windows import Window, WindowError, bounds as window_bounds
+from typing import List, Optional, Sequence, Tuple, Union
+
+from .DaskBackend import chunk_windows, lazy_array, require_dask, write_array
+from .RasterOutput import RasterOutput
+from ..utils.Instrumentation import stage
+
+
+# the engines that can crop a raster
+CROP_ENGINES = ("mask", "windowed", "dask")
+
+
+def write_cropped_raster(raster: DatasetReader, shapes: Sequence, output_file: str, output: RasterOutput,
+                         engine: str="mask", block_size: int=512, scheduler: str="threads", workers: int=1) -> None:
+    """Crop the raster to the shapes and write the result
+
+    engine "mask" masks the whole crop area in memory with rasterio; engine "windowed" reads
+    only the window under the shapes, one block at a time, and streams it to the output;
+    engine "dask" crops the same blocks as chunks of a lazy dask array computed by workers
+    on the local scheduler ("threads", "processes" or "synchronous").
+    Pixels outside the shapes get the nodata value of the raster; a raster without one gets
+    default_nodata(dtype) so they are never mistaken for data, unless output.mask_band marks
+    them in an internal 1-bit mask band instead.
+    """
+    shapes = [shape for shape in shapes if shape is not None and not shape.is_empty]
+    if engine not in CROP_ENGINES:
+        raise ValueError(f"Unknown crop engine: {engine}")
+    # the read, mask and write of a crop are interleaved block by block, so they are measured as one stage
+    with stage("crop_raster", path=raster.name, engine=engine, output=output_file):
+        if engine == "mask":
+            _crop_mask(raster, shapes, output_file, output)
+        elif engine == "windowed":
+            _crop_windowed(raster, shapes, output_file, output, block_size)
+        elif engine == "dask":
+            require_dask(scheduler)
+            _crop_dask(raster, shapes, output_file, output, block_size, scheduler, workers)
+    return None
+
+
+def default_nodata(dtype: str) -> Union[int, float]:
+    """A nodata value for a dtype: -9999 for floats, the lowest signed or the highest unsigned integer"""
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.floating):
+        return -9999.0
+    if np.issubdtype(dtype, np.signedinteger):
+        return int(np.iinfo(dtype).min)
+    if np.issubdtype(dtype, np.unsignedinteger):
+        return int(np.iinfo(dtype).max)
+    # complex rasters keep the 0 fill of rasterio.mask
+    return 0
+
+
+def fill_value(raster: DatasetReader, output: RasterOutput) -> Tuple[Union[int, float], Optional[Union[int, float]]]:
+    """The value of the pixels outside the shapes and the nodata of the output"""
+    if raster.nodata is not None:
+        return raster.nodata, raster.nodata
+    if output.mask_band:
+        # the mask band tells the pixels apart, so the data keeps no nodata value
+        return 0, None
+    nodata = default_nodata(raster.dtypes[0])
+    return nodata, nodata
+
+
+def crop_raster(raster: DatasetReader, shapes: List, output: RasterOutput) -> Tuple[np.ndarray, Affine, np.ndarray, Window]:
+    """Crop the raster to the shapes in memory, filling the outside like the written crops
+
+    Returns the cropped array, its transform, the mask of the pixels outside the shapes and the
+    window of the raster that was read.
+    """
+    fill, _ = fill_value(raster, output)
+    shapes = [shape for shape in shapes if shape is not None and not shape.is_empty]
+    # a single 2D mask covers every band, instead of the per-band masked array of rasterio.mask
+    outside, raster_transform, crop_window = raster_geometry_mask(raster, shapes, crop=True)
+    raster_cropped = raster.read(window=crop_window)
+    raster_cropped[:, outside] = fill
+    return raster_cropped, raster_transform, outside, crop_window
+
+
+def _crop_mask(raster: DatasetReader, shapes: List, output_file: str, output: RasterOutput) -> None:
+    """Crop the raster by masking the whole crop area in memory"""
+    _, nodata = fill_value(raster, output)
+    raster_cropped, raster_transform, outside, crop_window = crop_raster(raster, shapes, output)
+    # update the metadata
+    raster_meta = raster.meta.copy()
+    raster_meta.update({"driver": "GTiff",
+                        "height": raster_cropped.shape[1],
+                        "width": raster_cropped.shape[2],
+                        "transform": raster_transform,
+                        "nodata": nodata})
+    # save the raster file
+    with output.open(output_file, raster_meta) as dst:
+        dst.write(raster_cropped)
+        if output.mask_band:
+            valid = ~outside & (raster.dataset_mask(window=crop_window) > 0)
+            dst.write_mask(valid.astype("uint8") * 255)
+    return None
+
+
+def _crop_windowed(raster: DatasetReader, shapes: List, output_file: str, output: RasterOutput, block_size: int) -> None:
+    """Crop the raster by reading and masking the window under the shapes block by block"""
+    fill, nodata = fill_value(raster, output)
+    crop_window, raster_meta = _crop_grid(raster, shapes, block_size, nodata)
+    # index the shapes so each block only rasterises the parts that touch it
+    shapes = np.asarray(shapes, dtype=object)
+    tree = shapely.STRtree(shapes)
+    with output.open(output_file, raster_meta) as dst:
+        for _, out_window in dst.block_windows(1):
+            src_window = _source_window(crop_window, out_window)
+            block, valid = _crop_block(raster, src_window, _block_shapes(shapes, tree, src_window, raster.transform),
+                                       fill, output.mask_band)
+            dst.write(block, window=out_window)
+            if valid is not None:
+                dst.write_mask(valid, window=out_window)
+    return None
+
+
+def _crop_dask(raster: DatasetReader, shapes: List, output_file: str, output: RasterOutput, block_size: int,
+               scheduler: str, workers: int) -> None:
+    """Crop the raster as a lazy dask raster whose chunks are the blocks of the windowed crop"""
+    fill, nodata = fill_value(raster, output)
+    crop_window, raster_meta = _crop_grid(raster, shapes, block_size, nodata)
+    shapes = np.asarray(shapes, dtype=object)
+    tree = shapely.STRtree(shapes)
+    grid = chunk_windows(crop_window.height, crop_window.width, block_size)
+    # each chunk carries only the shapes touching it and opens the raster itself, so it runs on any scheduler
+    cropped = lazy_array(grid, raster.count, raster.dtypes[0],
+                         partial(_crop_chunk, raster.name, crop_window, fill, output.mask_band),
+                         inputs=lambda window: (_block_shapes(shapes, tree, _source_window(crop_window, window),
+                                                              raster.transform),),
+                         with_mask=output.mask_band)
+    with output.open(output_file, raster_meta) as dst:
+        write_array(cropped, dst, scheduler, workers)
+    return None
+
+
+def _crop_chunk(raster_path: str, crop_window: Window, fill: Union[int, float], with_mask: bool, out_window: Window,
+                block_shapes: np.ndarray):
+    """Crop one chunk of the dask crop from its own handle on the raster"""
+    with rasterio.open(raster_path) as raster:
+        block, valid = _crop_block(raster, _source_window(crop_window, out_window), block_shapes, fill, with_mask)
+    return (block, valid) if with_mask else block
+
+
+def _crop_grid(raster: DatasetReader, shapes: List, block_size: int, nodata: Optional[Union[int, float]]):
+    """The source window under the shapes and the metadata of the tiled output covering it"""
+    if block_size <= 0 or block_size % 16 != 0:
+        raise ValueError("block_size should be a positive multiple of 16.")
+    # the pixel window covering the shapes, clipped to the raster
+    try:
+        crop_window = geometry_window(raster, shapes)
+    except WindowError:
+        raise ValueError("Input shapes do not overlap raster.")
+    crop_window = Window(int(crop_window.col_off), int(crop_window.row_off), int(crop_window.width), int(crop_window.height))
+
+    raster_meta = raster.meta.copy()
+    raster_meta.update({"driver": "GTiff",
+                        "height": crop_window.height,
+                        "width": crop_window.width,
+                        "transform": raster.window_transform(crop_window),
+                        "nodata": nodata,
+                        "tiled": True,
+                        "blockxsize": block_size,
+                        "blockysize": block_size})
+    return crop_window, raster_meta
+
+
+def _source_window(crop_window: Window, out_window: Window) -> Window:
+    """The window of the source raster under a window of the cropped output"""
+    return Window(crop_window.col_off + out_window.col_off, crop_window.row_off + out_window.row_off,
+                  out_window.width, out_window.height)
+
+
+def _block_shapes(shapes: np.ndarray, tree: shapely.STRtree, src_window: Window, transform) -> np.ndarray:
+    """The shapes touching a source window, in their original order"""
+    return shapes[np.sort(tree.query(shapely.box(*window_bounds(src_window, transform))))]
+
+
+def _crop_block(raster: DatasetReader, src_window: Window, block_shapes: np.ndarray, fill: Union[int, float],
+                with_mask: bool=False) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Read a source window and set the pixels outside the shapes to the fill value
+
+    With with_mask, also return the GDAL mask of the block: 255 where the pixel is inside the
+    shapes and valid in the source, 0 elsewhere.
+    """
+    shape = (raster.count, int(src_window.height), int(src_window.width))
+    if len(block_shapes) == 0:
+        # the block lies in a gap between the shapes so nothing needs to be read
+        valid = np.zeros(shape[1:], dtype="uint8") if with_mask else None
+        return np.full(shape, fill, dtype=raster.dtypes[0]), valid
+    block = raster.read(window=src_window)
+    # only rasterise the mask where the block is not wholly inside one of the shapes
+    block_box = shapely.box(*window_bounds(src_window, raster.transform))
+    outside = None
+    if not shapely.contains(block_shapes, block_box).any():
+        outside = geometry_mask(block_shapes, out_shape=shape[1:], transform=raster.window_transform(src_window))
+        block[:, outside] = fill
+    if not with_mask:
+        return block, None
+    valid = raster.dataset_mask(window=src_window)
+    if outside is not None:
+        valid[outside] = 0
+    return block, valid
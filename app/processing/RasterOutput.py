@@ -0,0 +1,109 @@
+#this script shall write the raster outputs either as a plain GTiff or as a cloud-optimised GeoTIFF
+
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterator, Optional
+
+# rasterio is imported when an output is opened so the options can be built without it
+if TYPE_CHECKING:
+    import rasterio
+
+
+# the compressions accepted by both the GTiff and COG drivers
+COMPRESSIONS = ("DEFLATE", "ZSTD", "LZW", "LERC", "LERC_DEFLATE", "LERC_ZSTD")
+
+
+@dataclass
+class RasterOutput:
+    """Class to hold the options used to write a raster output"""
+    # write a cloud-optimised GeoTIFF (internal tiles and overviews) instead of a plain GTiff
+    cog: bool = False
+    # the compression such as DEFLATE, ZSTD or LERC; None keeps the output uncompressed
+    compress: Optional[str] = None
+    # use the horizontal (integer) or floating point predictor with DEFLATE, ZSTD and LZW
+    predictor: bool = True
+    # the compression level; None keeps the driver default
+    level: Optional[int] = None
+    # the maximum error allowed by LERC; 0 keeps it lossless
+    max_z_error: float = 0.0
+    # the size of the internal tiles
+    blocksize: int = 512
+    # the resampling used to build the overviews of a COG
+    overview_resampling: str = "average"
+    # mark the pixels outside the crop in an internal 1-bit mask band instead of with a nodata value
+    mask_band: bool = False
+
+    def __post_init__(self):
+        if self.compress is not None:
+            self.compress = self.compress.upper()
+            if self.compress not in COMPRESSIONS:
+                raise ValueError(f"compress should be one of {', '.join(COMPRESSIONS)}.")
+        if self.blocksize <= 0 or self.blocksize % 16 != 0:
+            raise ValueError("blocksize should be a positive multiple of 16.")
+
+    def profile(self, raster_meta: dict) -> dict:
+        """Return the GTiff profile used to write raster_meta with these options"""
+        profile = dict(raster_meta, driver="GTiff")
+        if self.cog or self.compress:
+            # keep the block size of callers that write block by block
+            profile.setdefault("tiled", True)
+            profile.setdefault("blockxsize", self.blocksize)
+            profile.setdefault("blockysize", self.blocksize)
+        if self.compress and not self.cog:
+            profile.update(self._compression_options(raster_meta["dtype"], cog=False))
+        return profile
+
+    @contextmanager
+    def open(self, output_path: str, raster_meta: dict) -> Iterator["rasterio.io.DatasetWriter"]:
+        """Open the output for writing; a COG is written to a temporary GTiff and converted on close"""
+        import rasterio
+        # keep the mask band inside the GTiff, where GDAL stores it deflated at 1 bit per pixel, rather than in a .msk file
+        with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True):
+            if not self.cog:
+                with rasterio.open(output_path, "w", **self.profile(raster_meta)) as dst:
+                    yield dst
+                return
+            with self._open_cog(output_path, raster_meta) as dst:
+                yield dst
+
+    @contextmanager
+    def _open_cog(self, output_path: str, raster_meta: dict) -> Iterator["rasterio.io.DatasetWriter"]:
+        """Write a temporary GTiff and copy it to a COG on close"""
+        import rasterio
+        from rasterio.shutil import copy as copy_raster
+        # the COG driver can only copy a finished dataset, so write an uncompressed tiled GTiff first
+        tmp_path = output_path + ".tmp.tif"
+        try:
+            with rasterio.open(tmp_path, "w", **self.profile(raster_meta)) as dst:
+                yield dst
+            copy_raster(tmp_path, output_path, driver="COG",
+                        blocksize=self.blocksize,
+                        overview_resampling=self.overview_resampling,
+                        bigtiff="IF_SAFER",
+                        **self._compression_options(raster_meta["dtype"], cog=True))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _compression_options(self, dtype: str, cog: bool) -> dict:
+        """Return the creation options of the compression for the GTiff or the COG driver"""
+        if not self.compress:
+            return {}
+        options = {"compress": self.compress}
+        if self.compress.startswith("LERC"):
+            options["max_z_error"] = self.max_z_error
+        elif self.predictor:
+            # the COG driver picks the predictor from the dtype, GTiff needs it spelled out
+            if cog:
+                options["predictor"] = "YES"
+            else:
+                options["predictor"] = 3 if dtype.startswith("float") else 2
+        if self.level is not None:
+            if cog:
+                options["level"] = self.level
+            elif self.compress.endswith("DEFLATE"):
+                options["zlevel"] = self.level
+            elif self.compress.endswith("ZSTD"):
+                options["zstd_level"] = self.level
+        return options
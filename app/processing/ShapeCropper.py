@@ -3,37 +3,102 @@
 # the shapefile is a polygon that will be used to crop the raster and vector file
 
 import os
-import geopandas as gpd
-import rasterio
-from rasterio.mask import mask
-from dataclasses import dataclass
+import glob
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
 from abc import ABC, abstractmethod
-from typing import Optional
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
 from pathlib import Path
 
+from .CropTasks import RasterCropTask, VectorCropTask, run_tasks, to_wkb
+from .DaskBackend import SCHEDULERS
+from .RasterOutput import RasterOutput
+from .VectorOutput import VectorOutput
+from ..utils.BuildCache import BuildCache
+from ..utils.GeometryCache import ClipLayer, geometry_cache
+from ..utils.HandlePool import gdal_env
+from ..utils.Instrumentation import instrumentation, stage
+from ..utils.Profiling import Profiler
+
+# the raster stack (rasterio) and the vector stack (geopandas, pyproj, pyogrio) are imported where they are
+# first needed, so importing this module or a merge does not pay for the other one, nor does a raster-only run
+# where fiona reads the clip layer (see GeometryCache.read_layer)
+if TYPE_CHECKING:
+    import geopandas as gpd
+    import rasterio
+
 
 @dataclass
 class GeoData:
     """Class to hold data"""
     # the path to the shapefile with cropping area 
     shapefile_path: str
-    # the path to the raster file and this will be optional
-    raster_path: Optional[str] = None
-    # the path to the vector file
-    vector_path: Optional[str] = None
+    # the path to the raster file and this will be optional; a VRT mosaic from merge_raster(mode="vrt") works too,
+    # in which case only the source tiles under the crop polygon are decoded.
+    # a list of paths or a glob pattern crops several raster files in one job with the MultiCropper
+    raster_path: Optional[Union[str, List[str]]] = None
+    # the path to the vector file; like the raster path this can be a list of paths or a glob pattern
+    vector_path: Optional[Union[str, List[str]]] = None
     # the path to the output directory; this shall automatically be created in the currently working directory
     output_path: str = os.path.join(os.getcwd(), "output")
+    # the compression and COG layout of the cropped raster
+    raster_output: RasterOutput = field(default_factory=RasterOutput)
+    # the format of the cropped vector file: shp, gpkg, fgb or parquet
+    vector_output: VectorOutput = field(default_factory=VectorOutput)
+    # how the raster is cropped: "mask" in memory, "windowed" block by block from the source window,
+    # or "dask" as a lazy chunked array computed out of core
+    crop_engine: str = "mask"
+    # the block size used by the windowed and dask crop engines
+    block_size: int = 512
+    # the local dask scheduler of the dask crop engine: "threads", "processes" or "synchronous"
+    dask_scheduler: str = "threads"
+    # how the vector file is clipped: "overlay" with geopandas' full overlay, which joins the attributes of the
+    # clip polygons, or "index" with a spatial index, much faster but keeping the attributes of the features only
+    vector_engine: str = "overlay"
+    # what the reader is given to skip features early: the clip polygon "mask", its "bbox" or "none"
+    vector_pushdown: str = "mask"
+    # the number of processes the crops are spread over, and the dask workers of the dask engine; 1 runs them one after another
+    workers: int = 1
+    # the size of the GDAL block cache in megabytes; None keeps the GDAL default
+    gdal_cache_mb: Optional[int] = None
 
     def __post_init__(self):
+        # expand the lists and glob patterns into the input files
+        self.raster_paths: List[str] = expand_paths(self.raster_path)
+        self.vector_paths: List[str] = expand_paths(self.vector_path)
         # check if at least one of raster or vector file exists
-        if not self.raster_path and not self.vector_path:
+        if not self.raster_paths and not self.vector_paths:
             raise ValueError("At least one of raster or vector file should exist.")
+        if self.dask_scheduler not in SCHEDULERS:
+            raise ValueError(f"dask_scheduler should be one of {', '.join(SCHEDULERS)}.")
+        # the engines are checked against the stack of the inputs that use them
+        if self.raster_paths:
+            from .RasterCrop import CROP_ENGINES
+            if self.crop_engine not in CROP_ENGINES:
+                raise ValueError(f"crop_engine should be one of {', '.join(CROP_ENGINES)}.")
+        if self.vector_paths:
+            from .VectorClip import PUSHDOWNS, VECTOR_ENGINES
+            if self.vector_engine not in VECTOR_ENGINES:
+                raise ValueError(f"vector_engine should be one of {', '.join(VECTOR_ENGINES)}.")
+            if self.vector_pushdown not in PUSHDOWNS:
+                raise ValueError(f"vector_pushdown should be one of {', '.join(PUSHDOWNS)}.")
+        # a single input keeps a plain path so the single file croppers can use it directly
+        if len(self.raster_paths) == 1:
+            self.raster_path = self.raster_paths[0]
+        if len(self.vector_paths) == 1:
+            self.vector_path = self.vector_paths[0]
+        # every input of a multi-file job gets an output named after it, so the names must not collide
+        for paths in (self.raster_paths, self.vector_paths):
+            stems = [Path(path).stem for path in paths]
+            if len(set(stems)) != len(stems):
+                raise ValueError("The input files of one kind should have distinct names.")
 
         # create output directory if it doesn't exist
         Path(self.output_path).mkdir(parents=True, exist_ok=True)
 
         # set the path to the output raster file
-        if self.raster_path:
+        if self.raster_paths:
             self.output_raster_path: str = os.path.join(self.output_path, "output_raster")
             Path(self.output_raster_path).mkdir(parents=True, exist_ok=True)
 
@@ -42,6 +107,48 @@ class GeoData:
             self.output_vector_path: str = os.path.join(self.output_path, "output_vector")
             Path(self.output_vector_path).mkdir(parents=True, exist_ok=True)
 
+    def raster_output_file(self, raster_path: str) -> str:
+        """The path of the cropped output of a raster file"""
+        name = "raster_cropped" if len(self.raster_paths) == 1 else f"{Path(raster_path).stem}_cropped"
+        return os.path.join(self.output_raster_path, name + ".tif")
+
+    def vector_output_name(self, vector_path: str) -> str:
+        """The name, without suffix, of the cropped output of a vector file"""
+        return "vector_cropped" if len(self.vector_paths) == 1 else f"{Path(vector_path).stem}_cropped"
+
+
+def expand_paths(paths: Optional[Union[str, List[str]]]) -> List[str]:
+    """Expand a path, a list of paths or glob patterns into a list of file paths"""
+    if not paths:
+        return []
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    expanded = []
+    for path in map(os.fspath, paths):
+        if any(char in path for char in "*?["):
+            matches = sorted(glob.glob(path))
+            if not matches:
+                raise ValueError(f"No file matches {path}.")
+            expanded.extend(matches)
+        else:
+            expanded.append(path)
+    return expanded
+
+
+def crop_vector_file(geo_data: GeoData) -> "gpd.GeoDataFrame":
+    """Crop the vector file of geo_data to the shapefile"""
+    from .VectorClip import clip_vector, read_crs, read_vector
+
+    # read the shapefile transformed to the crs of the vector file, from the cache when it was done before
+    shapefile_transformed = geometry_cache.get(geo_data.shapefile_path, read_crs(geo_data.vector_path))
+    # read only the features the shapefile may cover, then crop them
+    with stage("read_vector", path=geo_data.vector_path, pushdown=geo_data.vector_pushdown) as record:
+        vector = read_vector(geo_data.vector_path, shapefile_transformed, geo_data.vector_pushdown)
+        record["features"] = len(vector)
+    with stage("clip_vector", engine=geo_data.vector_engine):
+        vector_cropped = clip_vector(vector, shapefile_transformed, geo_data.vector_engine)
+    return vector_cropped
+
 
 # create abstract class for cropping method depeding on the file type such raster or shapefile
 
@@ -49,6 +156,34 @@ class GeoData:
 class Cropper(ABC):
     """Abstract class for cropping"""
     geo_data: GeoData 
+    # the handle on the raster file, opened on first use
+    _raster: Optional["rasterio.io.DatasetReader"] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def raster(self) -> "rasterio.io.DatasetReader":
+        """The raster file of the geo data, opened lazily and kept open until close()"""
+        import rasterio
+        if self._raster is None or self._raster.closed:
+            self._raster = rasterio.open(self.geo_data.raster_path)
+        return self._raster
+
+    def close(self):
+        """Release the handle on the raster file"""
+        if self._raster is not None:
+            self._raster.close()
+            self._raster = None
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def tasks(self):
+        """Describe the crops as independent tasks, or None when the cropper only runs as a whole"""
+        return None
 
     @abstractmethod
     def transform_crs(self):
@@ -69,40 +204,42 @@ class RasterCropper(Cropper):
     geo_data: GeoData
 
     def __post_init__(self):
-        # open the raster file once and keep the handle for later use
-        self.raster = rasterio.open(self.geo_data.raster_path)
+        if len(self.geo_data.raster_paths) != 1:
+            raise ValueError("RasterCropper crops one raster file; use MultiCropper for several.")
 
     def transform_crs(self):
         """Take corrdinate reference system of the shapefile and transform it to that of the raster file"""
-        # read the shapefile
-        shapefile = gpd.read_file(self.geo_data.shapefile_path)
-        # transform the shapefile to the crs of the raster file
-        shapefile_transformed = shapefile.to_crs(self.raster.crs)
+        # read the shapefile transformed to the crs of the raster file, from the cache when it was done before;
+        # the raster crop only needs its geometries, so geopandas is not loaded where fiona reads them
+        shapefile_transformed = geometry_cache.layer(self.geo_data.shapefile_path, self.raster.crs)
         return shapefile_transformed
 
     def crop(self):
         """Crop the raster file using the shapefile"""
         # read the shapefile
         shapefile_transformed = self.transform_crs()
-        # crop the raster file
-        raster_cropped, raster_transform = mask(dataset=self.raster, shapes=shapefile_transformed.geometry, crop=True)
+        # crop the raster file; the outside gets the same fill as the saved crops
+        from .RasterCrop import crop_raster
+        raster_cropped, raster_transform, _, _ = crop_raster(self.raster, shapefile_transformed.geometry,
+                                                             self.geo_data.raster_output)
         return raster_cropped, raster_transform
 
     def execute(self):
         """Save the cropped raster file"""
-        # crop the raster file
-        raster_cropped, raster_transform = self.crop()
-        # update the metadata
-        raster_meta = self.raster.meta.copy()
-        raster_meta.update({"driver": "GTiff",
-                            "height": raster_cropped.shape[1],
-                            "width": raster_cropped.shape[2],
-                            "transform": raster_transform})
-        # save the raster file
-        with rasterio.open(os.path.join(self.geo_data.output_raster_path, "raster_cropped.tif"), "w", **raster_meta) as dst:
-            dst.write(raster_cropped)
+        # read the shapefile
+        shapefile_transformed = self.transform_crs()
+        # crop and save the raster file with the configured engine
+        from .RasterCrop import write_cropped_raster
+        write_cropped_raster(self.raster, shapefile_transformed.geometry,
+                             os.path.join(self.geo_data.output_raster_path, "raster_cropped.tif"),
+                             self.geo_data.raster_output, self.geo_data.crop_engine, self.geo_data.block_size,
+                             self.geo_data.dask_scheduler, self.geo_data.workers)
         return None
 
+    def tasks(self):
+        """Describe the raster crop as a task"""
+        return [raster_crop_task(self.geo_data, self.geo_data.raster_path, self.transform_crs())]
+
 
 # create a class for cropping vector file
 @dataclass
@@ -111,21 +248,20 @@ class VectorCropper(Cropper):
     geo_data: GeoData
 
     def __post_init__(self):
-        # read the shapefile
-        self.shapefile = gpd.read_file(self.geo_data.shapefile_path)
+        if len(self.geo_data.vector_paths) != 1:
+            raise ValueError("VectorCropper crops one vector file; use MultiCropper for several.")
 
     def transform_crs(self):
-        """Take corrdinate reference system of the raster file and transform it to that of the shapefile"""
-        # transform the shapefile to the crs of the raster file
-        shapefile_transformed = self.shapefile.to_crs(self.geo_data.get_crs)
+        """Take corrdinate reference system of the shapefile and transform it to that of the vector file"""
+        # read the shapefile transformed to the crs of the vector file, from the cache when it was done before
+        from .VectorClip import read_crs
+        shapefile_transformed = geometry_cache.get(self.geo_data.shapefile_path, read_crs(self.geo_data.vector_path))
         return shapefile_transformed
 
     def crop(self):
         """Crop the vector file using the shapefile"""
-        # read the shapefile
-        shapefile_transformed = self.transform_crs()
         # crop the vector file
-        vector_cropped = gpd.overlay(shapefile_transformed, self.geo_data.vector_path, how="intersection")
+        vector_cropped = crop_vector_file(self.geo_data)
         return vector_cropped
 
     def execute(self):
@@ -133,9 +269,16 @@ class VectorCropper(Cropper):
         # crop the vector file
         vector_cropped = self.crop()
         # save the vector file
-        vector_cropped.to_file(os.path.join(self.geo_data.output_vector_path, "vector_cropped.shp"))
+        with stage("write_vector", format=self.geo_data.vector_output.format, features=len(vector_cropped)):
+            self.geo_data.vector_output.write(vector_cropped, self.geo_data.output_vector_path)
         return None
 
+    def tasks(self):
+        """Describe the vector crop as a task"""
+        from .VectorClip import read_crs
+        clip = geometry_cache.layer(self.geo_data.shapefile_path, read_crs(self.geo_data.vector_path))
+        return [vector_crop_task(self.geo_data, self.geo_data.vector_path, clip)]
+
 
 # create a class for cropping both raster and vector file
 @dataclass
@@ -144,54 +287,173 @@ class BothCropper(Cropper):
     geo_data: GeoData
 
     def __post_init__(self):
-        # open the raster file once and keep the handle for later use
-        self.raster = rasterio.open(self.geo_data.raster_path)
-        # read the shapefile
-        self.shapefile = gpd.read_file(self.geo_data.shapefile_path)
+        if len(self.geo_data.raster_paths) != 1 or len(self.geo_data.vector_paths) != 1:
+            raise ValueError("BothCropper crops one raster and one vector file; use MultiCropper for several.")
 
     def transform_crs(self):
         """Take corrdinate reference system of the shapefile and transform it to that of the raster file"""
-        # transform the shapefile to the crs of the raster file
-        shapefile_transformed = self.shapefile.to_crs(self.raster.crs)
+        # read the shapefile transformed to the crs of the raster file, from the cache when it was done before;
+        # the raster crop only needs its geometries, so geopandas is not loaded where fiona reads them
+        shapefile_transformed = geometry_cache.layer(self.geo_data.shapefile_path, self.raster.crs)
         return shapefile_transformed
 
     def crop(self):
         """Crop the raster and vector file using the shapefile"""
         # read the shapefile
         shapefile_transformed = self.transform_crs()
-        # crop the raster file
-        raster_cropped, raster_transform = mask(dataset=self.raster, shapes=shapefile_transformed.geometry, crop=True)
-        # crop the vector file
-        vector_cropped = gpd.overlay(shapefile_transformed, self.geo_data.vector_path, how="intersection")
+        # crop the raster file; the outside gets the same fill as the saved crops
+        from .RasterCrop import crop_raster
+        raster_cropped, raster_transform, _, _ = crop_raster(self.raster, shapefile_transformed.geometry,
+                                                             self.geo_data.raster_output)
+        # crop the vector file in its own crs
+        vector_cropped = crop_vector_file(self.geo_data)
         return raster_cropped, raster_transform, vector_cropped
 
+    def tasks(self):
+        """Describe the raster and vector crops as tasks that can run in separate processes"""
+        # reproject the shapefile once per crs; the workers receive the result as WKB
+        from .VectorClip import read_crs
+        raster_clip = self.transform_crs()
+        vector_clip = geometry_cache.layer(self.geo_data.shapefile_path, read_crs(self.geo_data.vector_path))
+        return [raster_crop_task(self.geo_data, self.geo_data.raster_path, raster_clip),
+                vector_crop_task(self.geo_data, self.geo_data.vector_path, vector_clip)]
+
     def execute(self):
         """Save the cropped raster and vector file"""
-        # crop the raster and vector file
-        raster_cropped, raster_transform, vector_cropped = self.crop()
-        # update the metadata
-        raster_meta = self.raster.meta.copy()
-        raster_meta.update({"driver": "GTiff",
-                            "height": raster_cropped.shape[1],
-                            "width": raster_cropped.shape[2],
-                            "transform": raster_transform})
-        # save the raster file
-        with rasterio.open(os.path.join(self.geo_data.output_raster_path, "raster_cropped.tif"), "w", **raster_meta) as dst:
-            dst.write(raster_cropped)
+        # crop the raster and vector file in separate processes so the wall time is the slower of the two
+        if self.geo_data.workers > 1:
+            run_tasks(self.tasks(), self.geo_data.workers)
+            return None
+        # read the shapefile
+        shapefile_transformed = self.transform_crs()
+        # crop and save the raster file with the configured engine
+        from .RasterCrop import write_cropped_raster
+        write_cropped_raster(self.raster, shapefile_transformed.geometry,
+                             os.path.join(self.geo_data.output_raster_path, "raster_cropped.tif"),
+                             self.geo_data.raster_output, self.geo_data.crop_engine, self.geo_data.block_size,
+                             self.geo_data.dask_scheduler, self.geo_data.workers)
+        # crop the vector file in its own crs
+        vector_cropped = crop_vector_file(self.geo_data)
         # save the vector file
-        vector_cropped.to_file(os.path.join(self.geo_data.output_vector_path, "vector_cropped.shp"))
+        with stage("write_vector", format=self.geo_data.vector_output.format, features=len(vector_cropped)):
+            self.geo_data.vector_output.write(vector_cropped, self.geo_data.output_vector_path)
+        return None
+
+
+# create a class for cropping many raster and vector files in one job
+@dataclass
+class MultiCropper(Cropper):
+    """Class for cropping every raster and vector file of the geo data"""
+    geo_data: GeoData
+
+    def transform_crs(self) -> Dict[str, ClipLayer]:
+        """Transform the shapefile once to each distinct crs of the inputs and return it per input file"""
+        import rasterio
+        from pyproj import CRS
+        from .VectorClip import read_crs
+
+        crs_by_path = {}
+        for raster_path in self.geo_data.raster_paths:
+            # only the header of the raster is read
+            with rasterio.open(raster_path) as raster:
+                crs_by_path[raster_path] = CRS.from_user_input(raster.crs).to_wkt()
+        for vector_path in self.geo_data.vector_paths:
+            crs_by_path[vector_path] = CRS.from_user_input(read_crs(vector_path)).to_wkt()
+        # inputs sharing a crs share one reprojected shapefile
+        transformed = {crs: geometry_cache.layer(self.geo_data.shapefile_path, crs) for crs in set(crs_by_path.values())}
+        return {path: transformed[crs] for path, crs in crs_by_path.items()}
+
+    def tasks(self):
+        """Describe the crop of every input file as a task"""
+        clips = self.transform_crs()
+        tasks = [raster_crop_task(self.geo_data, raster_path, clips[raster_path]) for raster_path in self.geo_data.raster_paths]
+        tasks += [vector_crop_task(self.geo_data, vector_path, clips[vector_path]) for vector_path in self.geo_data.vector_paths]
+        return tasks
+
+    def crop(self) -> List[str]:
+        """Crop every input file through one shared worker pool and return the output paths"""
+        return run_tasks(self.tasks(), self.geo_data.workers)
+
+    def execute(self):
+        """Save the cropped raster and vector files"""
+        self.crop()
         return None
 
 
+def raster_crop_task(geo_data: GeoData, raster_path: str, clip: ClipLayer) -> RasterCropTask:
+    """Describe the crop of a raster file to the clip, which is in the crs of the raster"""
+    return RasterCropTask(raster_path=raster_path,
+                          clip_wkb=to_wkb(clip.geometry),
+                          output_file=geo_data.raster_output_file(raster_path),
+                          output=geo_data.raster_output,
+                          engine=geo_data.crop_engine,
+                          block_size=geo_data.block_size,
+                          scheduler=geo_data.dask_scheduler,
+                          workers=geo_data.workers,
+                          gdal_cache_mb=geo_data.gdal_cache_mb)
+
+
+def vector_crop_task(geo_data: GeoData, vector_path: str, clip: ClipLayer) -> VectorCropTask:
+    """Describe the crop of a vector file to the clip, which is in the crs of the vector file"""
+    return VectorCropTask(vector_path=vector_path,
+                          clip_wkb=to_wkb(clip.geometry),
+                          crs=clip.crs,
+                          output_dir=geo_data.output_vector_path,
+                          name=geo_data.vector_output_name(vector_path),
+                          clip_attributes=clip.attributes,
+                          output=geo_data.vector_output,
+                          engine=geo_data.vector_engine,
+                          pushdown=geo_data.vector_pushdown,
+                          gdal_cache_mb=geo_data.gdal_cache_mb)
+
+
 # create application class
 @dataclass
 class Application:
     """Class for the application"""
     geo_data: GeoData
     cropper: Cropper
+    # skip the outputs whose inputs, clip geometry and parameters are unchanged since they were written
+    use_build_cache: bool = True
+    build_cache: BuildCache = field(default_factory=BuildCache)
+    # print a table of the time, memory and I/O of every stage once the run is done
+    summary: bool = False
+    # profile the run and write the reports to <output path>/profiles; None runs it unprofiled
+    profiler: Optional[Profiler] = None
+    # a process pool shared with other applications, e.g. by the jobs of a job file; None starts one per run
+    executor: Optional[Executor] = field(default=None, repr=False, compare=False)
 
     def execute(self):
         """Execute the application"""
-        self.cropper.execute()
+        # the summary covers this execution only, not the earlier ones of the same process
+        started = datetime.now(timezone.utc).isoformat()
+        if self.profiler is None:
+            self._execute()
+        else:
+            with self.profiler.profile(type(self.cropper).__name__, self.geo_data.output_path):
+                self._execute()
+        if self.summary:
+            print(instrumentation.summary(since=started))
+        return None
+
+    def _execute(self):
+        """Run the cropper, or only its stale tasks when the build cache is used"""
+        # the cropper's raster handle is released once it is done, even when it fails
+        with stage("application", cropper=type(self.cropper).__name__), gdal_env(self.geo_data.gdal_cache_mb), self.cropper:
+            if not self.use_build_cache:
+                self.cropper.execute()
+                return None
+            with stage("plan_tasks"):
+                tasks = self.cropper.tasks()
+            if tasks is None:
+                self.cropper.execute()
+                return None
+            # only the tasks with a missing or outdated output are run
+            with stage("build_cache", tasks=len(tasks)) as record:
+                stale = [task for task in tasks if not self.build_cache.is_fresh(task)]
+                record["stale"] = len(stale)
+            run_tasks(stale, self.geo_data.workers, self.executor)
+            for task in stale:
+                self.build_cache.record(task)
         return None
 
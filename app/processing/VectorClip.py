@@ -0,0 +1,145 @@
+#this script shall clip vector features to a polygon layer
+# candidates come from a bounding box query on a spatial index, features wholly inside the polygon are kept
+# untouched and only the features crossing its boundary are intersected
+
+import numpy as np
+import geopandas as gpd
+import shapely
+from typing import Optional
+
+# pyogrio reads straight into arrays (and Arrow tables when pyarrow is there) instead of feature by feature
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+# the engines that can clip a vector file
+VECTOR_ENGINES = ("index", "overlay")
+# how the clip polygon is pushed down to the reader: its geometry, its bounding box or not at all
+PUSHDOWNS = ("mask", "bbox", "none")
+
+
+def set_gdal_cache(cache_mb: Optional[int]) -> None:
+    """Limit the GDAL block cache of the vector reader to cache_mb megabytes; None keeps the GDAL default
+
+    pyogrio carries its own GDAL, which the rasterio environment does not reach, so the limit is
+    set on it directly, for the rest of the process.
+    """
+    if cache_mb is not None and pyogrio is not None:
+        # given in bytes like gdal_env, so both limits read the same whatever the GDAL version
+        pyogrio.set_gdal_config_options({"GDAL_CACHEMAX": int(cache_mb) * 1024 * 1024})
+    return None
+
+
+def read_crs(vector_path: str):
+    """Read the crs of a vector file without reading its features"""
+    if pyogrio is not None:
+        return pyogrio.read_info(vector_path)["crs"]
+    return gpd.read_file(vector_path, rows=slice(0, 1)).crs
+
+
+def read_vector(vector_path: str, clip: Optional[gpd.GeoDataFrame]=None, pushdown: str="mask") -> gpd.GeoDataFrame:
+    """Read the features of the vector file that may intersect clip
+
+    The clip polygon (pushdown "mask") or its bounds (pushdown "bbox") is handed to OGR as a spatial
+    filter, so the spatial indexes of GeoPackage, FlatGeobuf and shapefiles with a .qix are used and
+    features outside the filter are never deserialised. clip should be in the crs of the vector file.
+    """
+    if pushdown not in PUSHDOWNS:
+        raise ValueError(f"pushdown should be one of {', '.join(PUSHDOWNS)}.")
+    kwargs = {}
+    if pyogrio is not None:
+        kwargs["engine"] = "pyogrio"
+        if pyarrow is not None:
+            kwargs["use_arrow"] = True
+    if clip is not None and pushdown == "mask":
+        kwargs["mask"] = shapely.union_all(np.asarray(clip.geometry.values))
+    elif clip is not None and pushdown == "bbox":
+        kwargs["bbox"] = tuple(clip.total_bounds)
+    return gpd.read_file(vector_path, **kwargs)
+
+
+def clip_vector(features: gpd.GeoDataFrame, clip: gpd.GeoDataFrame, engine: str="overlay") -> gpd.GeoDataFrame:
+    """Clip the features to the polygons of clip
+
+    engine "overlay" runs geopandas' full overlay, splitting a feature once per clip polygon it
+    crosses and joining the attributes of the clip polygons; engine "index" is much faster on
+    large layers but keeps the attributes of the features only and clips to the union of clip.
+    """
+    if clip.crs != features.crs:
+        clip = clip.to_crs(features.crs)
+    if engine == "index":
+        return _clip_indexed(features, clip)
+    elif engine == "overlay":
+        return _clip_overlay(features, clip)
+    raise ValueError(f"Unknown vector engine: {engine}")
+
+
+def _clip_overlay(features: gpd.GeoDataFrame, clip: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """Clip the features with geopandas' overlay, keeping each feature's own geometry type
+
+    overlay keeps the geometry type of its first frame, which is the clip polygons, and would
+    drop every line and point feature; so it keeps every type and the intersections are cut
+    back to the dimension of the feature they come from.
+    """
+    features = features.assign(**{_DIMENSION: shapely.get_dimensions(np.asarray(features.geometry.values))})
+    vector_cropped = gpd.overlay(clip, features, how="intersection", keep_geom_type=False)
+    geometries = _keep_geom_type(np.asarray(vector_cropped.geometry.values), vector_cropped[_DIMENSION].to_numpy())
+    vector_cropped[vector_cropped.geometry.name] = gpd.GeoSeries(geometries, index=vector_cropped.index,
+                                                                 crs=vector_cropped.crs)
+    vector_cropped = vector_cropped[~shapely.is_empty(geometries)].drop(columns=_DIMENSION)
+    return vector_cropped.reset_index(drop=True)
+
+
+def _clip_indexed(features: gpd.GeoDataFrame, clip: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """Clip the features with a spatial index and exact intersection on the boundary features only"""
+    clip_geometry = shapely.union_all(np.asarray(clip.geometry.values))
+    if clip_geometry is None or clip_geometry.is_empty or features.empty:
+        return features.iloc[:0].copy()
+    # prepared geometries make the repeated predicates below much cheaper
+    shapely.prepare(clip_geometry)
+
+    # features whose bounding box intersects that of the clip polygon
+    candidates = np.sort(features.sindex.query(clip_geometry))
+    geometries = np.asarray(features.geometry.values)[candidates]
+
+    # features wholly inside the clip polygon are kept as they are
+    inside = shapely.covers(clip_geometry, geometries)
+    # the rest are intersected only if they actually touch the clip polygon
+    crossing = ~inside & shapely.intersects(clip_geometry, geometries)
+    clipped = geometries.copy()
+    clipped[crossing] = _keep_geom_type(shapely.intersection(geometries[crossing], clip_geometry),
+                                        shapely.get_dimensions(geometries[crossing]))
+    keep = inside | (crossing & ~shapely.is_empty(clipped))
+
+    vector_cropped = features.iloc[candidates[keep]].copy()
+    vector_cropped[features.geometry.name] = gpd.GeoSeries(clipped[keep], index=vector_cropped.index, crs=features.crs)
+    return vector_cropped
+
+
+def _keep_geom_type(clipped: np.ndarray, dimensions: np.ndarray) -> np.ndarray:
+    """Drop the parts of the intersections that are of lower dimension than their source features"""
+    clipped = clipped.copy()
+    # geometry collections can mix dimensions, so they are always split up
+    mixed = (shapely.get_dimensions(clipped) != dimensions) | (shapely.get_type_id(clipped) == shapely.GeometryType.GEOMETRYCOLLECTION)
+    for i in np.flatnonzero(mixed & ~shapely.is_empty(clipped)):
+        parts = shapely.get_parts(clipped[i])
+        parts = parts[shapely.get_dimensions(parts) == dimensions[i]]
+        if len(parts) == 0:
+            clipped[i] = shapely.from_wkt("GEOMETRYCOLLECTION EMPTY")
+        elif len(parts) == 1:
+            clipped[i] = parts[0]
+        else:
+            clipped[i] = _MULTI_BUILDERS[dimensions[i]](parts)
+    return clipped
+
+
+# the column carrying the dimension of each feature through the overlay
+_DIMENSION = "__dimension"
+# the constructors of a multi-part geometry by dimension
+_MULTI_BUILDERS = {0: shapely.multipoints, 1: shapely.multilinestrings, 2: shapely.multipolygons}
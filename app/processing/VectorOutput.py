@@ -0,0 +1,48 @@
+#this script shall write the vector outputs as a shapefile, GeoPackage, FlatGeobuf or GeoParquet
+
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+# geopandas is only needed once there is a frame to write
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+
+# the file suffix and OGR driver of each output format; GeoParquet is written by geopandas itself
+VECTOR_FORMATS = {"shp": (".shp", "ESRI Shapefile"),
+                  "gpkg": (".gpkg", "GPKG"),
+                  "fgb": (".fgb", "FlatGeobuf"),
+                  "parquet": (".parquet", None)}
+
+
+@dataclass
+class VectorOutput:
+    """Class to hold the options used to write a vector output"""
+    # one of shp, gpkg, fgb or parquet
+    format: str = "shp"
+    # the number of rows per GeoParquet row group; smaller groups let bbox reads skip more of the file
+    row_group_size: int = 65536
+
+    def __post_init__(self):
+        self.format = self.format.lower()
+        if self.format not in VECTOR_FORMATS:
+            raise ValueError(f"format should be one of {', '.join(VECTOR_FORMATS)}.")
+
+    @property
+    def suffix(self) -> str:
+        """The file suffix of the format"""
+        return VECTOR_FORMATS[self.format][0]
+
+    def write(self, frame: "gpd.GeoDataFrame", output_dir: str, name: str="vector_cropped") -> str:
+        """Write the frame to output_dir/name in the format and return the path"""
+        output_file = os.path.join(output_dir, name + self.suffix)
+        if self.format == "parquet":
+            # the covering bbox column is what lets readers skip row groups outside a bbox
+            frame.to_parquet(output_file, write_covering_bbox=True, row_group_size=self.row_group_size)
+        elif self.format == "shp":
+            frame.to_file(output_file, driver=VECTOR_FORMATS[self.format][1])
+        else:
+            # GeoPackage gets an R-tree and FlatGeobuf a packed Hilbert R-tree
+            frame.to_file(output_file, driver=VECTOR_FORMATS[self.format][1], SPATIAL_INDEX="YES")
+        return output_file
@@ -0,0 +1,274 @@
+#this script shall keep the merge and crop machinery warm in a local job server so each job skips the imports and caches
+# usage: python -m app serve --port 8765 --workers 2
+#
+# the server speaks a small JSON over HTTP on localhost; the body of a job is a job file as JSON, or the path of one:
+#
+#   curl -X POST localhost:8765/jobs -d '{"base_dir": "/data", "tasks": [{"type": "merge", "raster_paths": "tiles/*.tif", "output_path": "dem.tif"}]}'
+#   curl -X POST localhost:8765/jobs -d '{"job_file": "/data/jobs.yaml"}'
+#   curl localhost:8765/jobs/<id>
+#
+# the jobs run on a bounded pool of worker processes that live as long as the server, so the imports, the PROJ
+# database, the GDAL drivers and the geometry cache of a worker are paid for once and shared by the jobs it runs
+# each job runs inside one worker, so the workers of a job file are ignored; the server's --workers sets the parallelism
+
+import os
+import json
+import time
+import uuid
+import signal
+import asyncio
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from http import HTTPStatus
+from typing import Dict, List, Optional, Tuple
+
+from .cli import Job, job_from_dict, load_job, run_job
+
+
+# the states of a job; a job is queued until a worker picks it up
+JOB_STATES = ("queued", "running", "done", "failed")
+# the largest request body accepted
+MAX_BODY_BYTES = 1024 * 1024
+# the signals that stop the server
+STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+# the GDAL environment a worker keeps open for its lifetime, so the drivers are registered once
+_worker_env = None
+
+
+def warm_up() -> None:
+    """Initialise a worker process: import the croppers and merges, and load the PROJ database and GDAL drivers"""
+    global _worker_env
+    from .processing import CropTasks, ShapeCropper
+    try:
+        from .processing import BatchCropper, MergeRaster, RasterCrop, VectorClip
+        import rasterio
+        from pyproj import CRS, Transformer
+    except ImportError:
+        # the jobs report the missing package themselves
+        return None
+    _worker_env = rasterio.Env()
+    _worker_env.__enter__()
+    Transformer.from_crs(CRS.from_epsg(4326), CRS.from_epsg(3857), always_xy=True)
+    return None
+
+
+def inline(job: Job) -> Job:
+    """The job with every task run in the calling process
+
+    A job run by a server worker must not start pools of its own: they would escape the bound
+    of the server pool and run in fresh processes without the warm imports and caches.
+    """
+    tasks = []
+    for task in job.tasks:
+        task = {**task, "workers": 1}
+        # a single worker process still leaves the server pool, so the dask chunks run in the worker itself
+        for key in ("scheduler", "dask_scheduler"):
+            if task.get(key) == "processes":
+                task[key] = "synchronous"
+        tasks.append(task)
+    return replace(job, tasks=tasks, workers=1)
+
+
+def execute_job(job: Job, keep_going: bool) -> Tuple[str, List[dict], str]:
+    """Run a job in a worker process as a run of its own; returns the run id, the task results and the stage summary"""
+    from .utils.Instrumentation import instrumentation
+
+    run_id = instrumentation.new_run()
+    results = run_job(inline(job), keep_going=keep_going)
+    return run_id, [result.__dict__ for result in results], instrumentation.summary(run_id)
+
+
+@dataclass
+class ServiceJob:
+    """Class to hold a job submitted to the server and how it went"""
+    id: str
+    job: Job = field(repr=False)
+    status: str = "queued"
+    submitted: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    # the time from submission to the end of the job, waiting in the queue included
+    seconds: Optional[float] = None
+    # the instrumentation run the stages of the job were logged under
+    run_id: Optional[str] = None
+    tasks: List[dict] = field(default_factory=list)
+    summary: Optional[str] = None
+    error: Optional[str] = None
+    _start: float = field(default_factory=time.perf_counter, repr=False)
+
+    def to_dict(self, detail: bool=True) -> dict:
+        """The job as sent to the clients"""
+        document = {"id": self.id, "status": self.status, "submitted": self.submitted, "seconds": self.seconds,
+                    "run_id": self.run_id, "error": self.error}
+        if detail:
+            document["tasks"] = self.tasks or [{"name": task["name"], "type": task["type"], "status": "pending"}
+                                               for task in self.job.tasks]
+            document["summary"] = self.summary
+        return document
+
+
+class JobServer:
+    """Class to hold the worker pool and the jobs of the server, and answer its HTTP requests"""
+
+    def __init__(self, workers: int=2, max_queued: int=64, keep_going: bool=False):
+        if workers < 1:
+            raise ValueError("workers should be at least 1.")
+        self.workers = workers
+        self.max_queued = max_queued
+        self.keep_going = keep_going
+        self.jobs: Dict[str, ServiceJob] = {}
+        self._futures: Dict[str, Future] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        """Start the worker processes and warm each of them up before the first job arrives"""
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up)
+        # a pool starts its processes on demand; one no-op per worker starts them all
+        for _ in range(self.workers):
+            self._pool.submit(os.getpid)
+        return None
+
+    def close(self) -> None:
+        """Stop the worker processes, dropping the jobs that have not started"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        return None
+
+    def submit(self, document: dict) -> ServiceJob:
+        """Check a job document and queue it; raises ValueError when it is invalid and OverflowError when the queue is full"""
+        if self.queued() >= self.max_queued:
+            raise OverflowError(f"{self.max_queued} jobs are already queued.")
+        document = dict(document)
+        if "job_file" in document:
+            job = load_job(document["job_file"])
+        else:
+            job = job_from_dict(document, document.pop("base_dir", os.getcwd()))
+        service_job = ServiceJob(id=uuid.uuid4().hex[:12], job=job)
+        self.jobs[service_job.id] = service_job
+        future = self._pool.submit(execute_job, job, document.get("keep_going", self.keep_going))
+        self._futures[service_job.id] = future
+        future.add_done_callback(lambda future: self._finish(service_job, future))
+        return service_job
+
+    def queued(self) -> int:
+        """The number of jobs waiting for a worker"""
+        return sum(1 for job in self.jobs.values() if self._refresh(job).status == "queued")
+
+    def _refresh(self, job: ServiceJob) -> ServiceJob:
+        """Mark a queued job as running once a worker has taken it"""
+        future = self._futures.get(job.id)
+        if job.status == "queued" and future is not None and future.running():
+            job.status = "running"
+        return job
+
+    def _finish(self, job: ServiceJob, future: Future) -> None:
+        """Record the outcome of a job; runs in the thread of the pool that collects results"""
+        job.seconds = round(time.perf_counter() - job._start, 3)
+        self._futures.pop(job.id, None)
+        if future.cancelled():
+            job.status, job.error = "failed", "cancelled"
+            return None
+        error = future.exception()
+        if error is not None:
+            job.status, job.error = "failed", f"{type(error).__name__}: {error}"
+            return None
+        job.run_id, job.tasks, job.summary = future.result()
+        job.status = "failed" if any(task["status"] == "failed" for task in job.tasks) else "done"
+        return None
+
+    def handle(self, method: str, path: str, body: bytes) -> Tuple[int, object]:
+        """Answer a request with a status code and a JSON document"""
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if parts == ["health"] and method == "GET":
+            states = [self._refresh(job).status for job in self.jobs.values()]
+            return HTTPStatus.OK, {"status": "ok", "pid": os.getpid(), "workers": self.workers,
+                                   "jobs": {state: states.count(state) for state in JOB_STATES}}
+        if parts == ["jobs"] and method == "GET":
+            return HTTPStatus.OK, [self._refresh(job).to_dict(detail=False) for job in self.jobs.values()]
+        if parts == ["jobs"] and method == "POST":
+            try:
+                document = json.loads(body or b"{}")
+                if not isinstance(document, dict):
+                    raise ValueError("The body should be a JSON object.")
+                job = self.submit(document)
+            except OverflowError as error:
+                return HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)}
+            except (OSError, ValueError, ImportError) as error:
+                return HTTPStatus.BAD_REQUEST, {"error": str(error)}
+            return HTTPStatus.ACCEPTED, job.to_dict()
+        if len(parts) == 2 and parts[0] == "jobs" and method == "GET":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                return HTTPStatus.NOT_FOUND, {"error": f"There is no job {parts[1]}."}
+            return HTTPStatus.OK, self._refresh(job).to_dict()
+        if parts in (["health"], ["jobs"]) or (len(parts) == 2 and parts[0] == "jobs"):
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"{method} is not allowed on {path}."}
+        return HTTPStatus.NOT_FOUND, {"error": f"There is nothing at {path}."}
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Read one HTTP request from the connection, answer it and close the connection"""
+        try:
+            request = await read_request(reader)
+            status, document = (HTTPStatus.BAD_REQUEST, {"error": "Malformed request."}) if request is None \
+                else self.handle(*request)
+        except Exception as error:
+            status, document = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(error).__name__}: {error}"}
+        payload = json.dumps(document, indent=2).encode()
+        writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+        return None
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, bytes]]:
+    """The method, path and body of an HTTP request, or None when it is malformed"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        return None
+    lines = head.decode("latin-1").split("\r\n")
+    request_line = lines[0].split()
+    if len(request_line) != 3:
+        return None
+    headers = {name.strip().lower(): value.strip() for name, _, value in (line.partition(":") for line in lines[1:] if line)}
+    length = int(headers.get("content-length", 0) or 0)
+    if length < 0 or length > MAX_BODY_BYTES:
+        return None
+    body = await reader.readexactly(length) if length else b""
+    return request_line[0].upper(), request_line[1], body
+
+
+async def serve(host: str="127.0.0.1", port: int=8765, workers: int=2, max_queued: int=64) -> None:
+    """Run the job server until it is interrupted or terminated, then stop its worker processes"""
+    server = JobServer(workers=workers, max_queued=max_queued)
+    server.start()
+    loop = asyncio.get_running_loop()
+    try:
+        listener = await asyncio.start_server(server.serve_connection, host, port)
+        address = listener.sockets[0].getsockname()
+        print(f"geo_app serving on http://{address[0]}:{address[1]} with {workers} workers", flush=True)
+        async with listener:
+            serving = asyncio.ensure_future(listener.serve_forever())
+            # SIGTERM (kill, systemd) would otherwise end the server without stopping the pool and orphan the workers
+            for signum in STOP_SIGNALS:
+                try:
+                    loop.add_signal_handler(signum, serving.cancel)
+                except NotImplementedError:
+                    # Windows event loops have no signal handlers; Ctrl+C still raises KeyboardInterrupt
+                    pass
+            try:
+                await serving
+            except asyncio.CancelledError:
+                pass
+    finally:
+        for signum in STOP_SIGNALS:
+            try:
+                loop.remove_signal_handler(signum)
+            except NotImplementedError:
+                pass
+        server.close()
+    return None
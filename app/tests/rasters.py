@@ -0,0 +1,55 @@
+#this script shall write the small synthetic rasters the tests merge and crop
+
+import os
+import importlib.util
+from typing import Optional
+
+# the raster tests need numpy and rasterio and are skipped where they are missing
+HAS_RASTERIO = all(importlib.util.find_spec(name) is not None for name in ("numpy", "rasterio"))
+# the crop tests need shapely as well, and the dask tests dask
+HAS_SHAPELY = HAS_RASTERIO and importlib.util.find_spec("shapely") is not None
+HAS_DASK = HAS_RASTERIO and importlib.util.find_spec("dask") is not None
+
+# the nodata value of the synthetic tiles
+NODATA = -9999.0
+
+
+def write_tile(path: str, data, left: float, top: float, res: float=1.0, nodata: Optional[float]=NODATA,
+               crs: str="EPSG:2193") -> str:
+    """Write a (count, height, width) or (height, width) array as a GeoTIFF whose top-left corner is at left, top"""
+    import numpy as np
+    import rasterio
+    from rasterio.transform import from_origin
+
+    data = np.asarray(data)
+    if data.ndim == 2:
+        data = data[np.newaxis]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with rasterio.open(path, "w", driver="GTiff", height=data.shape[1], width=data.shape[2], count=data.shape[0],
+                       dtype=data.dtype.name, crs=crs, transform=from_origin(left, top, res, res), nodata=nodata) as dst:
+        dst.write(data)
+    return path
+
+
+def random_tile(seed: int, size: int=32, holes: bool=True):
+    """A float32 tile of random values, with a square of nodata in it when holes is set"""
+    import numpy as np
+
+    data = np.random.default_rng(seed).uniform(0, 100, (size, size)).astype("float32")
+    if holes:
+        data[size // 4:size // 2, size // 4:size // 2] = NODATA
+    return data
+
+
+def read(path: str):
+    """The pixels of a raster"""
+    import rasterio
+    with rasterio.open(path) as src:
+        return src.read()
+
+
+def touch_later(path: str) -> None:
+    """Move the modification time of a file forward so its fingerprint changes even within the clock resolution"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000))
+    return None
@@ -0,0 +1,93 @@
+#this script shall check the batch cropper writes the same rasters as cropping each polygon on its own
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from .rasters import HAS_SHAPELY, random_tile, write_tile
+
+try:
+    import geopandas
+except ImportError:
+    geopandas = None
+
+# the named polygons of the layer: two neighbours, one apart from them and one partly off the raster
+POLYGONS = {"north": (4.0, 40.0, 20.0, 60.0), "north east": (22.0, 44.0, 36.0, 58.0),
+            "south": (30.0, 6.0, 50.0, 26.0), "edge": (56.0, 20.0, 72.0, 34.0)}
+
+
+@unittest.skipUnless(HAS_SHAPELY and geopandas is not None, "needs numpy, rasterio, shapely and geopandas")
+class BatchCropperTest(unittest.TestCase):
+    """Class to compare BatchRasterCropper with a mask crop of each polygon"""
+
+    def setUp(self):
+        from shapely import box
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.raster_path = write_tile(os.path.join(self.tmp.name, "dem.tif"), random_tile(seed=3, size=64),
+                                      left=0.0, top=64.0)
+        self.shapefile_path = os.path.join(self.tmp.name, "parcels.shp")
+        geopandas.GeoDataFrame({"name": list(POLYGONS)}, geometry=[box(*bounds) for bounds in POLYGONS.values()],
+                               crs="EPSG:2193").to_file(self.shapefile_path)
+        # keep the geometry cache of the tests out of the user's cache directory
+        patch = mock.patch("app.utils.GeometryCache.geometry_cache.use_disk", False)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def batch(self, name: str, mask_band: bool=False, **kwargs) -> str:
+        """Crop the raster to every polygon with the batch cropper and return the output directory"""
+        from ..processing.BatchCropper import BatchRasterCropper
+        from ..processing.RasterOutput import RasterOutput
+        from ..processing.ShapeCropper import GeoData
+
+        geo_data = GeoData(shapefile_path=self.shapefile_path, raster_path=self.raster_path,
+                           output_path=os.path.join(self.tmp.name, name), raster_output=RasterOutput(mask_band=mask_band))
+        with BatchRasterCropper(geo_data, **kwargs) as cropper:
+            cropper.execute()
+        return geo_data.output_raster_path
+
+    def single(self, polygon: str, mask_band: bool=False):
+        """Crop the raster to one polygon with the mask engine"""
+        import rasterio
+        from shapely import box
+        from ..processing.RasterCrop import write_cropped_raster
+        from ..processing.RasterOutput import RasterOutput
+
+        output_path = os.path.join(self.tmp.name, "single", f"{polygon}.tif")
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with rasterio.open(self.raster_path) as raster:
+            write_cropped_raster(raster, [box(*POLYGONS[polygon])], output_path, RasterOutput(mask_band=mask_band))
+        return self.read(output_path)
+
+    def read(self, path: str):
+        import rasterio
+        with rasterio.open(path) as raster:
+            return raster.read(), raster.dataset_mask(), raster.transform, raster.nodata
+
+    def assert_matches_single_crops(self, output_dir: str, mask_band: bool=False):
+        import numpy as np
+        from ..processing.BatchCropper import output_names
+        for polygon, name in zip(POLYGONS, output_names(POLYGONS)):
+            with self.subTest(polygon=polygon):
+                batch, single = self.read(os.path.join(output_dir, f"{name}.tif")), self.single(polygon, mask_band)
+                np.testing.assert_array_equal(batch[0], single[0])
+                np.testing.assert_array_equal(batch[1], single[1])
+                self.assertEqual(batch[2:], single[2:])
+
+    def test_polygon_by_polygon_matches_single_crops(self):
+        self.assert_matches_single_crops(self.batch("apart"))
+
+    def test_grouped_polygons_match_single_crops(self):
+        # every polygon falls in one group whose window is read once
+        self.assert_matches_single_crops(self.batch("grouped", group_distance=100.0))
+
+    def test_parallel_groups_match_single_crops(self):
+        self.assert_matches_single_crops(self.batch("parallel", group_distance=4.0, workers=2))
+
+    def test_mask_band_matches_single_crops(self):
+        self.assert_matches_single_crops(self.batch("mask_band", mask_band=True, group_distance=100.0), mask_band=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
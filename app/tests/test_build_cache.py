@@ -0,0 +1,98 @@
+#this script shall check the build cache only skips the crops whose inputs, parameters and outputs are untouched
+
+import os
+import tempfile
+import unittest
+
+from ..processing.CropTasks import RasterCropTask
+from ..utils.BuildCache import MANIFEST_SUFFIX, BuildCache
+from .rasters import touch_later
+
+
+class BuildCacheTest(unittest.TestCase):
+    """Class to exercise BuildCache.is_fresh and BuildCache.record on a raster crop task"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.raster_path = self.write("dem.tif", b"raster")
+        self.output_file = os.path.join(self.tmp.name, "out", "raster_cropped.tif")
+        self.cache = BuildCache()
+
+    def write(self, name: str, content: bytes) -> str:
+        path = os.path.join(self.tmp.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def task(self, clip_wkb=(b"boundary",), **kwargs) -> RasterCropTask:
+        # the build cache only hashes the WKB of the clip, so any bytes stand for a boundary
+        return RasterCropTask(raster_path=self.raster_path, clip_wkb=list(clip_wkb), output_file=self.output_file, **kwargs)
+
+    def build(self, task: RasterCropTask) -> None:
+        """Stand in for task.run: write the output, then record it like Application does"""
+        self.write(os.path.relpath(self.output_file, self.tmp.name), b"cropped")
+        self.cache.record(task)
+        return None
+
+    def test_missing_output_is_stale(self):
+        self.assertFalse(self.cache.is_fresh(self.task()))
+
+    def test_recorded_output_is_fresh(self):
+        self.build(self.task())
+        self.assertTrue(os.path.exists(self.output_file + MANIFEST_SUFFIX))
+        self.assertTrue(self.cache.is_fresh(self.task()))
+
+    def test_scheduling_does_not_make_stale(self):
+        self.build(self.task())
+        self.assertTrue(self.cache.is_fresh(self.task(workers=4, scheduler="processes", gdal_cache_mb=256)))
+
+    def test_changed_boundary_is_stale(self):
+        self.build(self.task())
+        self.assertFalse(self.cache.is_fresh(self.task(clip_wkb=(b"another boundary",))))
+
+    def test_changed_parameters_are_stale(self):
+        self.build(self.task())
+        self.assertFalse(self.cache.is_fresh(self.task(engine="windowed")))
+
+    def test_changed_input_is_stale(self):
+        self.build(self.task())
+        with open(self.raster_path, "ab") as f:
+            f.write(b"more")
+        self.assertFalse(self.cache.is_fresh(self.task()))
+
+    def test_touched_input_is_stale(self):
+        self.build(self.task())
+        touch_later(self.raster_path)
+        self.assertFalse(self.cache.is_fresh(self.task()))
+
+    def test_touched_input_with_same_content_is_fresh_when_hashing(self):
+        self.cache = BuildCache(hash_content=True)
+        self.build(self.task())
+        touch_later(self.raster_path)
+        self.assertTrue(self.cache.is_fresh(self.task()))
+
+    def test_hand_edited_output_is_stale(self):
+        self.build(self.task())
+        with open(self.output_file, "ab") as f:
+            f.write(b"edited")
+        self.assertFalse(self.cache.is_fresh(self.task()))
+
+    def test_deleted_output_is_stale(self):
+        self.build(self.task())
+        os.remove(self.output_file)
+        self.assertFalse(self.cache.is_fresh(self.task()))
+
+    def test_vrt_sources_are_inputs(self):
+        tile = self.write("tiles/tile_0.tif", b"tile")
+        self.raster_path = self.write("mosaic.vrt", b'<VRTDataset><VRTRasterBand><SimpleSource>'
+                                                    b'<SourceFilename relativeToVRT="1">tiles/tile_0.tif</SourceFilename>'
+                                                    b'</SimpleSource></VRTRasterBand></VRTDataset>')
+        self.build(self.task())
+        touch_later(tile)
+        self.assertFalse(self.cache.is_fresh(self.task()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+#this script shall check the block compositing of each merge method against rasterio.merge
+
+import os
+import tempfile
+import unittest
+
+from .rasters import HAS_RASTERIO, NODATA, random_tile, read, write_tile
+
+# the methods rasterio.merge implements as well
+RASTERIO_METHODS = ("first", "last", "min", "max")
+
+
+@unittest.skipUnless(HAS_RASTERIO, "needs numpy and rasterio")
+class CompositingTest(unittest.TestCase):
+    """Class to compare _merge_block with rasterio.merge on three overlapping tiles with nodata holes"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # three 32 pixel tiles shifted by 12 pixels along the diagonal, so some pixels are covered by all three
+        self.paths = [write_tile(os.path.join(self.tmp.name, f"tile_{i}.tif"), random_tile(seed=i),
+                                 left=12.0 * i, top=56.0 - 12.0 * i)
+                      for i in range(3)]
+
+    def merge_block(self, method: str, window=None):
+        """Composite the tiles into window of the output grid, the whole grid by default"""
+        from rasterio.windows import Window
+        from ..processing.MergeRaster import _merge_block, _output_meta
+        from ..utils.HandlePool import DatasetPool
+        from ..utils.TileIndex import TileIndex
+
+        index = TileIndex.from_paths(self.paths)
+        raster_meta = _output_meta(index)
+        window = window or Window(0, 0, raster_meta["width"], raster_meta["height"])
+        with DatasetPool() as pool:
+            return _merge_block(index.query(index.bounds), window, raster_meta, pool, method)
+
+    def rasterio_merge(self, method: str, paths=None):
+        from rasterio.merge import merge
+        merged, _ = merge(paths or self.paths, method=method)
+        return merged
+
+    def test_methods_match_rasterio(self):
+        import numpy as np
+        for method in RASTERIO_METHODS:
+            with self.subTest(method=method):
+                np.testing.assert_array_equal(self.merge_block(method), self.rasterio_merge(method))
+
+    def test_partial_block_matches_rasterio(self):
+        import numpy as np
+        from rasterio.windows import Window
+        # a block straddling the edges of all three tiles
+        for method in RASTERIO_METHODS:
+            with self.subTest(method=method):
+                np.testing.assert_array_equal(self.merge_block(method, Window(8, 16, 24, 24)),
+                                              self.rasterio_merge(method)[:, 16:40, 8:32])
+
+    def test_mean_averages_the_valid_pixels(self):
+        import numpy as np
+        # place each tile on the output grid as a masked array and average where any is valid
+        height = width = 56
+        stack = np.ma.masked_all((len(self.paths), height, width), dtype="float64")
+        for i, path in enumerate(self.paths):
+            data = read(path)[0].astype("float64")
+            stack[i, 12 * i:12 * i + 32, 12 * i:12 * i + 32] = np.ma.masked_equal(data, NODATA)
+        expected = stack.mean(axis=0).filled(NODATA).astype("float32")
+        np.testing.assert_allclose(self.merge_block("mean")[0], expected, rtol=1e-6)
+
+    def test_priority_is_first_over_the_tiles_by_descending_priority(self):
+        import numpy as np
+        from ..processing.MergeRaster import merge_raster
+
+        output_path = os.path.join(self.tmp.name, "priority.tif")
+        merge_raster(self.paths, output_path, mode="stream", block_size=16, method="priority", priority=[1, 3, 2])
+        expected = self.rasterio_merge("first", [self.paths[1], self.paths[2], self.paths[0]])
+        np.testing.assert_array_equal(read(output_path), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+#this script shall check the windowed crop engine writes the same raster as the mask crop engine, and how both mark the outside
+
+import os
+import tempfile
+import unittest
+
+from .rasters import HAS_SHAPELY, NODATA, random_tile, write_tile
+
+# the engines whose outputs are checked pixel by pixel
+ENGINES = ("mask", "windowed")
+
+
+class CropTestCase(unittest.TestCase):
+    """Class to crop a 64 pixel raster to a square and a triangle"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.raster_path = write_tile(os.path.join(self.tmp.name, "dem.tif"), random_tile(seed=7, size=64),
+                                      left=0.0, top=64.0)
+
+    def shapes(self):
+        from shapely import Polygon, box
+        # some blocks are wholly inside a shape, some are cut and some lie in the gap between the shapes
+        return [box(2.0, 30.0, 20.0, 50.0), Polygon([(26.0, 4.0), (52.0, 4.0), (52.0, 40.0)])]
+
+    def crop(self, name: str, mask_band: bool=False, shapes=None, **kwargs):
+        """Crop the raster and return the pixels, the dataset mask and the profile of the output"""
+        import rasterio
+        from ..processing.RasterCrop import write_cropped_raster
+        from ..processing.RasterOutput import RasterOutput
+
+        output_path = os.path.join(self.tmp.name, name)
+        with rasterio.open(self.raster_path) as raster:
+            write_cropped_raster(raster, shapes or self.shapes(), output_path, RasterOutput(mask_band=mask_band), **kwargs)
+        with rasterio.open(output_path) as cropped:
+            return cropped.read(), cropped.dataset_mask(), cropped.profile
+
+
+
+@unittest.skipUnless(HAS_SHAPELY, "needs numpy, rasterio and shapely")
+class CropEnginesTest(CropTestCase):
+    """Class to compare the windowed crop engine with the mask crop engine"""
+
+    def assert_same_crop(self, actual, expected):
+        import numpy as np
+        np.testing.assert_array_equal(actual[0], expected[0])
+        np.testing.assert_array_equal(actual[1], expected[1])
+        for key in ("width", "height", "transform", "crs", "nodata", "dtype"):
+            self.assertEqual(actual[2][key], expected[2][key], key)
+
+    def test_windowed_matches_mask(self):
+        for mask_band in (False, True):
+            with self.subTest(mask_band=mask_band):
+                expected = self.crop("mask.tif", mask_band)
+                self.assert_same_crop(self.crop("windowed.tif", mask_band, engine="windowed", block_size=16), expected)
+
+    def test_windowed_matches_mask_with_blocks_larger_than_the_crop(self):
+        self.assert_same_crop(self.crop("windowed.tif", engine="windowed", block_size=512), self.crop("mask.tif"))
+
+    def test_shapes_outside_the_raster_are_refused(self):
+        from shapely import box
+        for engine in ("mask", "windowed"):
+            with self.subTest(engine=engine), self.assertRaises(ValueError):
+                self.crop(f"{engine}.tif", shapes=[box(100.0, 100.0, 120.0, 120.0)], engine=engine)
+
+
+@unittest.skipUnless(HAS_SHAPELY, "needs numpy, rasterio and shapely")
+class CropNodataTest(CropTestCase):
+    """Class to check the value and mask given to the pixels outside the shapes"""
+
+    def source(self, dtype: str, nodata=None):
+        """Rewrite the raster as dtype with the given nodata, without a nodata hole"""
+        import numpy as np
+        data = np.random.default_rng(5).integers(1, 100, (64, 64)).astype(dtype)
+        self.raster_path = write_tile(os.path.join(self.tmp.name, f"dem_{dtype}.tif"), data, left=0.0, top=64.0,
+                                      nodata=nodata)
+        return data
+
+    def outside(self):
+        """The pixels of the crop outside the shapes, from a mask crop with a mask band"""
+        _, mask, _ = self.crop("outside.tif", mask_band=True)
+        return mask == 0
+
+    def test_outside_gets_the_nodata_of_the_raster(self):
+        self.source("float32", nodata=NODATA)
+        outside = self.outside()
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                data, mask, profile = self.crop(f"{engine}.tif", engine=engine, block_size=16)
+                self.assertEqual(profile["nodata"], NODATA)
+                self.assertTrue((data[:, outside] == NODATA).all())
+                self.assertTrue((mask[outside] == 0).all())
+
+    def test_raster_without_nodata_gets_one_for_its_dtype(self):
+        for dtype, nodata in (("float32", -9999.0), ("int16", -32768), ("uint8", 255)):
+            self.source(dtype)
+            outside = self.outside()
+            for engine in ENGINES:
+                with self.subTest(dtype=dtype, engine=engine):
+                    data, mask, profile = self.crop(f"{engine}_{dtype}.tif", engine=engine, block_size=16)
+                    self.assertEqual(profile["nodata"], nodata)
+                    self.assertTrue((data[:, outside] == nodata).all())
+                    self.assertTrue((mask[outside] == 0).all() and (mask[~outside] == 255).all())
+
+    def test_mask_band_marks_the_outside_without_nodata(self):
+        self.source("uint8")
+        outside = self.outside()
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                cropped, mask, profile = self.crop(f"{engine}.tif", mask_band=True, engine=engine, block_size=16)
+                self.assertIsNone(profile["nodata"])
+                self.assertTrue((cropped[:, outside] == 0).all())
+                self.assertTrue((mask[~outside] == 255).all())
+                # the source has no zeros, so the pixels inside kept their values
+                self.assertTrue((cropped[:, ~outside] > 0).all())
+
+    def test_mask_band_also_masks_the_nodata_pixels_inside(self):
+        import numpy as np
+        # the raster of setUp has a nodata hole under the square
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                cropped, mask, _ = self.crop(f"{engine}_holes.tif", mask_band=True, engine=engine, block_size=16)
+                holes = np.any(cropped == NODATA, axis=0)
+                self.assertTrue(holes.any())
+                self.assertTrue((mask[holes] == 0).all())
+
+    def test_in_memory_crop_fills_like_the_written_crop(self):
+        import numpy as np
+        import rasterio
+        from ..processing.RasterCrop import crop_raster
+        from ..processing.RasterOutput import RasterOutput
+
+        self.source("int16")
+        written, _, _ = self.crop("mask.tif")
+        with rasterio.open(self.raster_path) as raster:
+            cropped, _, _, _ = crop_raster(raster, self.shapes() + [None], RasterOutput())
+        np.testing.assert_array_equal(cropped, written)
+
+
+if __name__ == "__main__":
+    unittest.main()
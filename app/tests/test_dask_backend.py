@@ -0,0 +1,96 @@
+#this script shall check the dask merge and crop write what the other modes write, and that a write scales with the chunks
+
+import os
+import time
+import tempfile
+import unittest
+
+from .rasters import HAS_DASK, HAS_SHAPELY, random_tile, read, write_tile
+
+# the chunks of the scaling check; a write that culls the whole graph per chunk takes minutes here
+SCALING_CHUNKS = 6400
+# a generous bound on the scaling check, well above the few seconds of a linear write
+SCALING_SECONDS = 60.0
+
+
+def _no_op_block(window):
+    return None
+
+
+class _NullWriter:
+    """Class to stand in for a rasterio writer and count the chunks written to it"""
+
+    def __init__(self):
+        self.writes = 0
+
+    def write(self, data, window):
+        self.writes += 1
+
+
+@unittest.skipUnless(HAS_DASK and HAS_SHAPELY, "needs numpy, rasterio, shapely and dask")
+class DaskBackendTest(unittest.TestCase):
+    """Class to compare the dask merge and crop with the memory merge and mask crop"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # a 2 x 2 grid of 32 pixel tiles overlapping by 8 pixels, each with a nodata hole the others may fill
+        self.paths = [write_tile(os.path.join(self.tmp.name, f"tile_{i}.tif"), random_tile(seed=i),
+                                 left=24.0 * (i % 2), top=56.0 - 24.0 * (i // 2))
+                      for i in range(4)]
+
+    def merge(self, name: str, **kwargs):
+        from ..processing.MergeRaster import merge_raster
+        output_path = os.path.join(self.tmp.name, name)
+        merge_raster(self.paths, output_path, **kwargs)
+        return read(output_path)
+
+    def crop(self, name: str, mask_band: bool=False, **kwargs):
+        import rasterio
+        from shapely import Polygon, box
+        from ..processing.RasterCrop import write_cropped_raster
+        from ..processing.RasterOutput import RasterOutput
+
+        # a square and a triangle, so some blocks are wholly inside, some cut and some in the gap between them
+        shapes = [box(2.0, 30.0, 20.0, 50.0), Polygon([(26.0, 4.0), (52.0, 4.0), (52.0, 40.0)])]
+        output_path = os.path.join(self.tmp.name, name)
+        with rasterio.open(self.paths[0]) as raster:
+            write_cropped_raster(raster, shapes, output_path, RasterOutput(mask_band=mask_band), **kwargs)
+        with rasterio.open(output_path) as cropped:
+            return cropped.read(), cropped.dataset_mask()
+
+    def test_dask_merge_matches_memory(self):
+        import numpy as np
+        expected = self.merge("memory.tif", mode="memory")
+        for scheduler in ("synchronous", "threads"):
+            with self.subTest(scheduler=scheduler):
+                np.testing.assert_array_equal(self.merge(f"dask_{scheduler}.tif", mode="dask", block_size=16,
+                                                         scheduler=scheduler, workers=2), expected)
+
+    def test_dask_crop_matches_mask_crop(self):
+        import numpy as np
+        self.paths = [write_tile(os.path.join(self.tmp.name, "dem.tif"), random_tile(seed=7, size=64), left=0.0, top=64.0)]
+        for mask_band in (False, True):
+            expected = self.crop("mask.tif", mask_band)
+            for scheduler in ("synchronous", "threads"):
+                with self.subTest(mask_band=mask_band, scheduler=scheduler):
+                    data, mask = self.crop(f"dask_{scheduler}.tif", mask_band, engine="dask", block_size=16,
+                                           scheduler=scheduler, workers=2)
+                    np.testing.assert_array_equal(data, expected[0])
+                    np.testing.assert_array_equal(mask, expected[1])
+
+    def test_write_scales_with_the_chunks(self):
+        from ..processing.DaskBackend import chunk_windows, lazy_array, write_array
+
+        # 80 x 80 chunks of 16 pixels whose block does nothing, so the time is all graph handling
+        grid = chunk_windows(1280, 1280, 16)
+        dst = _NullWriter()
+        start = time.perf_counter()
+        write_array(lazy_array(grid, 1, "float32", _no_op_block), dst, scheduler="synchronous")
+        seconds = time.perf_counter() - start
+        self.assertEqual(dst.writes, SCALING_CHUNKS)
+        self.assertLess(seconds, SCALING_SECONDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
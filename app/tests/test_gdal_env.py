@@ -0,0 +1,45 @@
+#this script shall check gdal_env gives the GDAL block cache the size asked for
+
+import ctypes
+import unittest
+
+from .rasters import HAS_RASTERIO
+
+
+def _loaded_gdal():
+    """The GDAL library rasterio loaded into this process, or None where it cannot be found"""
+    import rasterio  # noqa: F401 loads the library
+    try:
+        with open("/proc/self/maps") as maps:
+            # the last field of a mapping is the file it maps
+            paths = {line.split()[-1] for line in maps if "libgdal" in line.rsplit("/", 1)[-1]}
+    except OSError:
+        return None
+    # wheels bundle a GDAL each, and pyogrio's is not the one gdal_env configures
+    paths = {path for path in paths if "rasterio" in path} or paths
+    for path in sorted(paths):
+        try:
+            library = ctypes.CDLL(path)
+            library.GDALGetCacheMax64.restype = ctypes.c_int64
+            return library
+        except (OSError, AttributeError):
+            continue
+    return None
+
+
+@unittest.skipUnless(HAS_RASTERIO, "needs numpy and rasterio")
+class GdalEnvTest(unittest.TestCase):
+    """Class to read the effective block cache back from GDAL inside gdal_env"""
+
+    def test_cache_is_set_in_megabytes(self):
+        from ..utils.HandlePool import gdal_env
+
+        gdal = _loaded_gdal()
+        if gdal is None:
+            self.skipTest("the GDAL library of rasterio is not reachable with ctypes here")
+        with gdal_env(64):
+            self.assertEqual(gdal.GDALGetCacheMax64(), 64 * 1024 * 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#this script shall check an incremental merge finds the changed tiles and ends up with the mosaic of a full merge
+
+import os
+import tempfile
+import unittest
+
+from .rasters import HAS_RASTERIO, random_tile, read, touch_later, write_tile
+
+# the compositing settings of the manifests written by the tests
+SETTINGS = {"method": "first", "resampling": "nearest"}
+
+
+@unittest.skipUnless(HAS_RASTERIO, "needs numpy and rasterio")
+class IncrementalMergeTest(unittest.TestCase):
+    """Class to exercise _dirty_footprints and the incremental streaming merge"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # four 32 pixel tiles side by side covering 0..64 in both directions, each with a nodata hole
+        self.paths = [self.tile(f"tile_{i}.tif", seed=i, left=32.0 * (i % 2), top=64.0 - 32.0 * (i // 2))
+                      for i in range(4)]
+        # a tile inside the extent over the hole of the first tile, so adding it changes pixels but not the grid
+        self.patch = self.tile("patch.tif", seed=10, left=4.0, top=60.0, size=16, holes=False)
+        self.output_path = os.path.join(self.tmp.name, "mosaic.tif")
+
+    def tile(self, name: str, seed: int, left: float, top: float, size: int=32, holes: bool=True) -> str:
+        return write_tile(os.path.join(self.tmp.name, name), random_tile(seed, size, holes), left=left, top=top)
+
+    def merge(self, paths, output_path=None, incremental=True):
+        from ..processing.MergeRaster import merge_raster
+        merge_raster(paths, output_path or self.output_path, mode="stream", block_size=16, incremental=incremental)
+        return read(output_path or self.output_path)
+
+    def dirty(self, paths, settings=None):
+        """The dirty footprints of paths against the manifest of the last merge"""
+        from ..processing.MergeRaster import _dirty_footprints, _output_meta
+        from ..utils.TileIndex import TileIndex
+
+        index = TileIndex.from_paths(paths)
+        raster_meta = _output_meta(index)
+        raster_meta.update({"tiled": True, "blockxsize": 16, "blockysize": 16})
+        return _dirty_footprints(self.output_path + ".manifest.json", self.output_path, index, raster_meta,
+                                 settings or SETTINGS)
+
+    def assert_matches_full_merge(self, paths):
+        import numpy as np
+        incremental = self.merge(paths)
+        full = self.merge(paths, os.path.join(self.tmp.name, "full.tif"), incremental=False)
+        np.testing.assert_array_equal(incremental, full)
+
+    def test_unchanged_tiles_are_clean(self):
+        self.merge(self.paths)
+        self.assertEqual(self.dirty(self.paths), [])
+
+    def test_added_tile_is_dirty(self):
+        self.merge(self.paths)
+        self.assertEqual(self.dirty(self.paths + [self.patch]), [(4.0, 44.0, 20.0, 60.0)])
+        self.assert_matches_full_merge(self.paths + [self.patch])
+
+    def test_changed_tile_is_dirty(self):
+        self.merge(self.paths)
+        write_tile(self.paths[3], random_tile(seed=20), left=32.0, top=32.0)
+        touch_later(self.paths[3])
+        self.assertIn((32.0, 0.0, 64.0, 32.0), self.dirty(self.paths))
+        self.assert_matches_full_merge(self.paths)
+
+    def test_removed_tile_is_dirty(self):
+        self.merge(self.paths + [self.patch])
+        self.assertEqual(self.dirty(self.paths), [(4.0, 44.0, 20.0, 60.0)])
+        self.assert_matches_full_merge(self.paths)
+
+    def test_reordered_tiles_need_a_full_merge(self):
+        self.merge(self.paths + [self.patch])
+        # the first tile wins on overlaps, so moving the patch ahead of the tile it covers changes the output
+        reordered = [self.patch] + self.paths
+        self.assertIsNone(self.dirty(reordered))
+        self.assert_matches_full_merge(reordered)
+
+    def test_changed_settings_need_a_full_merge(self):
+        self.merge(self.paths)
+        self.assertIsNone(self.dirty(self.paths, {**SETTINGS, "method": "max"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
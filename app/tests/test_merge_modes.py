@@ -0,0 +1,82 @@
+#this script shall check the streaming, parallel and VRT merges give the same mosaic as the in-memory merge
+
+import os
+import tempfile
+import unittest
+
+from .rasters import HAS_RASTERIO, random_tile, read, write_tile
+
+
+@unittest.skipUnless(HAS_RASTERIO, "needs numpy and rasterio")
+class MergeModesTest(unittest.TestCase):
+    """Class to compare the memory, stream, parallel stream and VRT merges on overlapping tiles"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # a 2 x 2 grid of 32 pixel tiles overlapping by 8 pixels, each with a nodata hole the others may fill
+        self.paths = [write_tile(os.path.join(self.tmp.name, f"tile_{i}.tif"), random_tile(seed=i),
+                                 left=24.0 * (i % 2), top=56.0 - 24.0 * (i // 2))
+                      for i in range(4)]
+
+    def merge(self, name: str, **kwargs):
+        from ..processing.MergeRaster import merge_raster
+        output_path = os.path.join(self.tmp.name, name)
+        merge_raster(self.paths, output_path, **kwargs)
+        return read(output_path)
+
+    def test_stream_matches_memory(self):
+        import numpy as np
+        expected = self.merge("memory.tif", mode="memory")
+        np.testing.assert_array_equal(self.merge("stream.tif", mode="stream", block_size=16), expected)
+
+    def test_parallel_stream_matches_memory(self):
+        import numpy as np
+        expected = self.merge("memory.tif", mode="memory")
+        np.testing.assert_array_equal(self.merge("parallel.tif", mode="stream", block_size=16, workers=2), expected)
+
+    def test_vrt_matches_memory(self):
+        import numpy as np
+        for method in ("first", "last"):
+            with self.subTest(method=method):
+                expected = self.merge(f"memory_{method}.tif", mode="memory", method=method)
+                np.testing.assert_array_equal(self.merge(f"mosaic_{method}.vrt", mode="vrt", method=method), expected)
+
+    def test_vrt_keeps_the_grid_and_crs_of_the_memory_merge(self):
+        import rasterio
+        self.merge("memory.tif", mode="memory")
+        self.merge("mosaic.vrt", mode="vrt")
+        with rasterio.open(os.path.join(self.tmp.name, "memory.tif")) as memory, \
+                rasterio.open(os.path.join(self.tmp.name, "mosaic.vrt")) as vrt:
+            self.assertEqual(vrt.transform, memory.transform)
+            self.assertEqual(vrt.crs, memory.crs)
+            self.assertEqual(vrt.nodata, memory.nodata)
+
+    def test_memory_merge_opens_one_tile_at_a_time(self):
+        import numpy as np
+        try:
+            import resource
+        except ImportError:
+            self.skipTest("needs the resource module to limit the open files")
+        # a catalogue of more tiles than the process may hold open at once
+        paths = [write_tile(os.path.join(self.tmp.name, "many", f"tile_{i}.tif"), random_tile(seed=i, size=16),
+                            left=16.0 * (i % 20), top=160.0 - 16.0 * (i // 20))
+                 for i in range(200)]
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(128, hard), hard))
+        try:
+            self.paths = paths
+            merged = self.merge("many.tif", mode="memory")
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+        self.assertEqual(merged.shape, (1, 160, 320))
+        np.testing.assert_array_equal(merged[0, :16, :16], read(paths[0])[0])
+
+    def test_stream_with_few_open_handles_matches_memory(self):
+        import numpy as np
+        expected = self.merge("memory.tif", mode="memory")
+        np.testing.assert_array_equal(self.merge("pooled.tif", mode="stream", block_size=16, max_open=1), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+#this script shall check the overlay and index vector engines clip polygon, line and point layers alike
+
+import importlib.util
+import unittest
+
+# the vector tests need geopandas and shapely
+HAS_GEOPANDAS = all(importlib.util.find_spec(name) is not None for name in ("geopandas", "shapely"))
+
+
+@unittest.skipUnless(HAS_GEOPANDAS, "needs geopandas and shapely")
+class VectorClipTest(unittest.TestCase):
+    """Class to compare the index and overlay engines of clip_vector"""
+
+    def setUp(self):
+        import geopandas as gpd
+        from shapely import box
+        self.clip = gpd.GeoDataFrame({"zone": ["a"]}, geometry=[box(10.0, 10.0, 50.0, 50.0)], crs="EPSG:2193")
+
+    def layer(self, geometries):
+        import geopandas as gpd
+        return gpd.GeoDataFrame({"id": list(range(len(geometries)))}, geometry=geometries, crs="EPSG:2193")
+
+    def clip_both(self, features):
+        from ..processing.VectorClip import clip_vector
+        return [clip_vector(features, self.clip, engine=engine).sort_values("id").reset_index(drop=True)
+                for engine in ("index", "overlay")]
+
+    def assert_same_clip(self, features):
+        import shapely
+        index, overlay = self.clip_both(features)
+        self.assertGreater(len(index), 0)
+        self.assertEqual(list(index["id"]), list(overlay["id"]))
+        self.assertTrue(shapely.equals(index.geometry.values, overlay.geometry.values).all())
+        # the overlay joins the attributes of the clip polygons in front of those of the features
+        self.assertEqual(list(overlay.columns[:2]), ["zone", "id"])
+
+    def test_polygons(self):
+        from shapely import box
+        # inside, crossing the edge and outside the clip box
+        self.assert_same_clip(self.layer([box(20.0, 20.0, 30.0, 30.0), box(40.0, 40.0, 60.0, 60.0),
+                                          box(70.0, 70.0, 80.0, 80.0)]))
+
+    def test_lines(self):
+        from shapely import LineString
+        # a pipe network of horizontal and vertical lines, some crossing the clip box and some outside it
+        lines = [LineString([(0.0, y), (60.0, y)]) for y in range(5, 60, 10)]
+        lines += [LineString([(x, 0.0), (x, 60.0)]) for x in range(5, 60, 10)]
+        lines.append(LineString([(20.0, 20.0), (30.0, 30.0)]))
+        self.assert_same_clip(self.layer(lines))
+
+    def test_points(self):
+        from shapely import Point
+        self.assert_same_clip(self.layer([Point(20.0, 20.0), Point(45.0, 15.0), Point(55.0, 55.0)]))
+
+
+if __name__ == "__main__":
+    unittest.main()
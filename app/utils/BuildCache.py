@@ -0,0 +1,91 @@
+#this script shall skip the crops whose inputs and parameters have not changed since their output was written
+# every output gets a <output>.build.json manifest holding the key of the inputs that produced it
+
+import os
+import json
+import hashlib
+import xml.etree.ElementTree as ET
+from typing import List, Optional
+
+from .GeometryCache import source_files
+
+
+# the suffix of the manifest written next to each output
+MANIFEST_SUFFIX = ".build.json"
+
+
+class BuildCache:
+    """Class to tell whether the outputs of a task are up to date with its inputs"""
+
+    def __init__(self, hash_content: bool=False):
+        # fingerprint the inputs by a hash of their contents instead of their size and modification time
+        self.hash_content = hash_content
+
+    def key(self, task) -> str:
+        """Content address of a task: its parameters and the fingerprints of its input files"""
+        digest = hashlib.sha256()
+        digest.update(json.dumps(task.params(), sort_keys=True, default=str).encode())
+        for path in task.inputs():
+            for source in _input_files(path):
+                digest.update(json.dumps(self.fingerprint(source)).encode())
+        return digest.hexdigest()
+
+    def fingerprint(self, path: str) -> list:
+        """Fingerprint of a single file"""
+        stat = os.stat(path)
+        if not self.hash_content:
+            return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return [os.path.abspath(path), digest.hexdigest()]
+
+    def is_fresh(self, task) -> bool:
+        """Check every output of the task exists, is untouched and was built from the same key"""
+        key = self.key(task)
+        for output in task.outputs():
+            manifest = _read_manifest(output)
+            if manifest is None or manifest["key"] != key:
+                return False
+            # an output edited or deleted by hand is rebuilt
+            if not os.path.exists(output) or manifest["output"] != _output_fingerprint(output):
+                return False
+        return True
+
+    def record(self, task) -> None:
+        """Write the manifest of every output of a task that has just run"""
+        key = self.key(task)
+        for output in task.outputs():
+            with open(output + MANIFEST_SUFFIX, "w") as f:
+                json.dump({"key": key, "output": _output_fingerprint(output), "inputs": task.inputs()}, f)
+        return None
+
+
+def _input_files(path: str) -> List[str]:
+    """The files an input is made of: shapefile sidecars, or the sources referenced by a VRT"""
+    files = source_files(path)
+    if path.lower().endswith(".vrt"):
+        vrt_dir = os.path.dirname(os.path.abspath(path))
+        for source in ET.parse(path).iter("SourceFilename"):
+            source_path = source.text or ""
+            if source.get("relativeToVRT") == "1":
+                source_path = os.path.join(vrt_dir, source_path)
+            if os.path.exists(source_path) and source_path not in files:
+                files.append(source_path)
+    return files
+
+
+def _output_fingerprint(output: str) -> list:
+    """Size and modification time of an output"""
+    stat = os.stat(output)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _read_manifest(output: str) -> Optional[dict]:
+    """Read the manifest of an output if there is a valid one"""
+    try:
+        with open(output + MANIFEST_SUFFIX) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,231 @@
+#this script shall cache the shapefiles reprojected to a crs so repeated crops do not read and reproject them again
+# the layers are read with fiona (or pyogrio) and reprojected with pyproj and shapely, so a raster crop does not load
+# geopandas where fiona is installed; pyogrio imports geopandas itself. the vector croppers turn them into GeoDataFrames
+
+import os
+import glob
+import json
+import pickle
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from .Instrumentation import stage
+
+# the readers, pyproj and shapely are imported on the first lookup so the build cache can use source_files without them
+if TYPE_CHECKING:
+    import geopandas as gpd
+    import numpy as np
+
+
+# the sidecar files that hold part of a shapefile's data
+SHAPEFILE_SIDECARS = (".shx", ".dbf", ".prj", ".cpg")
+# the format of the cached entries, part of their key so entries of an older format are never loaded
+CACHE_FORMAT = "clip-layer-1"
+
+
+@dataclass
+class ClipLayer:
+    """Class to hold the polygons of a vector file with their attributes, without geopandas"""
+    # the shapely geometries as an object array; missing geometries are None
+    geometry: "np.ndarray"
+    # the attribute values by field name, one per geometry
+    attributes: Dict[str, list]
+    # the crs of the geometries as WKT, or None when the file has none
+    crs: Optional[str]
+
+    def __len__(self) -> int:
+        return len(self.geometry)
+
+    def to_frame(self) -> "gpd.GeoDataFrame":
+        """The layer as a GeoDataFrame, for the vector croppers"""
+        import geopandas as gpd
+        return gpd.GeoDataFrame({name: list(values) for name, values in self.attributes.items()},
+                                geometry=gpd.GeoSeries(self.geometry.copy(), crs=self.crs))
+
+
+def read_layer(path: str) -> ClipLayer:
+    """Read the geometries and attributes of a vector file with fiona, or with pyogrio when fiona is missing
+
+    fiona comes first because importing pyogrio imports geopandas and pandas for its
+    GeoDataFrame readers, which is the cost the raster crops read the layer this way to avoid.
+    """
+    try:
+        import fiona
+    except ImportError:
+        fiona = None
+    if fiona is not None:
+        return _read_with_fiona(path)
+    try:
+        from pyogrio.raw import read
+    except ImportError:
+        raise ImportError("Reading the shapefile needs fiona or pyogrio; install one with `pip install fiona`.")
+    import shapely
+    meta, _, geometry, field_data = read(path)
+    return ClipLayer(geometry=shapely.from_wkb(geometry),
+                     attributes={name: values.tolist() for name, values in zip(meta["fields"], field_data)},
+                     crs=meta["crs"])
+
+
+def _read_with_fiona(path: str) -> ClipLayer:
+    """Read a vector file feature by feature with fiona"""
+    import fiona
+    import numpy as np
+    from shapely.geometry import shape
+
+    with fiona.open(path) as src:
+        fields = list(src.schema["properties"])
+        geometries, attributes = [], {name: [] for name in fields}
+        for feature in src:
+            # fiona 1.9 gives Feature objects, older versions plain dicts
+            geometry = feature["geometry"] if isinstance(feature, dict) else feature.geometry
+            properties = feature["properties"] if isinstance(feature, dict) else feature.properties
+            geometries.append(shape(geometry) if geometry else None)
+            for name in fields:
+                attributes[name].append(properties[name])
+        crs = src.crs_wkt or None
+    return ClipLayer(geometry=np.array(geometries, dtype=object), attributes=attributes, crs=crs)
+
+
+def reproject(layer: ClipLayer, crs: Any) -> ClipLayer:
+    """The layer with its geometries transformed to crs, in x, y order like GeoDataFrame.to_crs"""
+    import numpy as np
+    import shapely
+    from pyproj import CRS, Transformer
+
+    target = CRS.from_user_input(crs)
+    if layer.crs is None:
+        raise ValueError("The shapefile has no crs, so it cannot be transformed to that of the data.")
+    source = CRS.from_user_input(layer.crs)
+    if source == target:
+        return ClipLayer(layer.geometry, layer.attributes, target.to_wkt())
+    transformer = Transformer.from_crs(source, target, always_xy=True)
+    geometry = shapely.transform(layer.geometry, lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1])))
+    return ClipLayer(geometry, layer.attributes, target.to_wkt())
+
+
+def default_cache_dir() -> str:
+    """The on-disk cache directory, overridable with the GEO_APP_CACHE_DIR environment variable"""
+    return os.environ.get("GEO_APP_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "geo_app", "geometries"))
+
+
+class GeometryCache:
+    """Class to cache reprojected vector files in memory and on disk with LRU eviction"""
+
+    def __init__(self, max_items: int=32, cache_dir: Optional[str]=None, max_disk_items: int=256,
+                 use_disk: bool=True, hash_content: bool=False):
+        # the number of reprojected files kept in memory and on disk
+        self.max_items = max_items
+        self.max_disk_items = max_disk_items
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.use_disk = use_disk
+        # key on a hash of the file contents instead of their size and modification time
+        self.hash_content = hash_content
+        self._memory: "OrderedDict[str, ClipLayer]" = OrderedDict()
+
+    def get(self, path: str, crs: Any) -> "gpd.GeoDataFrame":
+        """Return the vector file reprojected to crs as a GeoDataFrame, reading and reprojecting it only on a cache miss"""
+        return self.layer(path, crs).to_frame()
+
+    def layer(self, path: str, crs: Any) -> ClipLayer:
+        """Return the vector file reprojected to crs without geopandas, reading and reprojecting it only on a cache miss"""
+        key = self.key(path, crs)
+        # in-process cache
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        # on-disk cache
+        layer = self._load(key)
+        if layer is None:
+            with stage("read_file", path=path):
+                layer = read_layer(path)
+            with stage("to_crs", features=len(layer)):
+                layer = reproject(layer, crs)
+            self._dump(key, layer)
+        self._remember(key, layer)
+        return layer
+
+    def key(self, path: str, crs: Any) -> str:
+        """Key of a file reprojected to crs: its path, its fingerprint and the target crs"""
+        digest = hashlib.sha256(CACHE_FORMAT.encode())
+        for source in source_files(path):
+            if self.hash_content:
+                with open(source, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(chunk)
+            else:
+                stat = os.stat(source)
+                digest.update(json.dumps([os.path.abspath(source), stat.st_size, stat.st_mtime_ns]).encode())
+        digest.update(os.path.abspath(path).encode())
+        from pyproj import CRS
+        digest.update(CRS.from_user_input(crs).to_wkt().encode())
+        return digest.hexdigest()
+
+    def clear(self) -> None:
+        """Empty the in-process cache and remove the on-disk entries"""
+        self._memory.clear()
+        for entry in glob.glob(os.path.join(self.cache_dir, "*.pkl")):
+            os.remove(entry)
+        return None
+
+    def _remember(self, key: str, layer: ClipLayer) -> None:
+        """Keep the layer in memory, evicting the least recently used one when full"""
+        self._memory[key] = layer
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+        return None
+
+    def _load(self, key: str) -> Optional[ClipLayer]:
+        """Load the layer from disk if it was cached there"""
+        if not self.use_disk:
+            return None
+        entry = os.path.join(self.cache_dir, f"{key}.pkl")
+        try:
+            with open(entry, "rb") as f:
+                layer = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if not isinstance(layer, ClipLayer):
+            return None
+        # touch the entry so eviction sees it as recently used
+        os.utime(entry)
+        return layer
+
+    def _dump(self, key: str, layer: ClipLayer) -> None:
+        """Save the layer to disk, evicting the least recently used entries when full"""
+        if not self.use_disk:
+            return None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = os.path.join(self.cache_dir, f"{key}.pkl")
+        # write to a temporary file first so a concurrent reader never sees half an entry
+        tmp_entry = f"{entry}.{os.getpid()}.tmp"
+        with open(tmp_entry, "wb") as f:
+            pickle.dump(layer, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_entry, entry)
+
+        entries = sorted(glob.glob(os.path.join(self.cache_dir, "*.pkl")), key=os.path.getmtime)
+        for old_entry in entries[:max(0, len(entries) - self.max_disk_items)]:
+            try:
+                os.remove(old_entry)
+            except OSError:
+                pass
+        return None
+
+
+def source_files(path: str) -> List[str]:
+    """The files that hold the data of a vector file, including the sidecars of a shapefile"""
+    sources = [path]
+    stem, ext = os.path.splitext(path)
+    if ext.lower() == ".shp":
+        for sidecar in SHAPEFILE_SIDECARS:
+            for candidate in (stem + sidecar, stem + sidecar.upper()):
+                if os.path.exists(candidate):
+                    sources.append(candidate)
+                    break
+    return sources
+
+
+# the cache shared by the croppers of this process
+geometry_cache = GeometryCache()
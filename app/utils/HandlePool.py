@@ -0,0 +1,61 @@
+#this script shall keep a bounded number of rasterio datasets open so large tile catalogues do not exhaust file descriptors
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional
+
+# rasterio is imported on first use so importing the croppers stays cheap
+if TYPE_CHECKING:
+    import rasterio
+
+
+def gdal_env(cache_mb: Optional[int]=None) -> "rasterio.Env":
+    """GDAL environment with the block cache limited to cache_mb megabytes; None keeps the GDAL default"""
+    import rasterio
+    if cache_mb is None:
+        return rasterio.Env()
+    # rasterio hands GDAL_CACHEMAX to GDALSetCacheMax64, which takes bytes
+    return rasterio.Env(GDAL_CACHEMAX=int(cache_mb) * 1024 * 1024)
+
+
+class DatasetPool:
+    """Class to hold open rasterio datasets, opened lazily and closed least recently used first"""
+
+    def __init__(self, max_open: int=64):
+        if max_open < 1:
+            raise ValueError("max_open should be at least 1.")
+        self.max_open = max_open
+        self._datasets: "OrderedDict[str, rasterio.io.DatasetReader]" = OrderedDict()
+
+    def get(self, path: str) -> "rasterio.io.DatasetReader":
+        """Return an open handle on the dataset
+
+        The handle stays valid until max_open other datasets have been requested after it.
+        """
+        import rasterio
+        dataset = self._datasets.get(path)
+        if dataset is None or dataset.closed:
+            dataset = rasterio.open(path)
+            self._datasets[path] = dataset
+        self._datasets.move_to_end(path)
+        # close the least recently used handles beyond the limit
+        while len(self._datasets) > self.max_open:
+            _, oldest = self._datasets.popitem(last=False)
+            oldest.close()
+        return dataset
+
+    def close(self) -> None:
+        """Close every open handle"""
+        while self._datasets:
+            _, dataset = self._datasets.popitem()
+            dataset.close()
+        return None
+
+    def __len__(self) -> int:
+        return len(self._datasets)
+
+    def __enter__(self) -> "DatasetPool":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.close()
+        return False
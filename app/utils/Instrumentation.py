@@ -0,0 +1,163 @@
+#this script shall record the wall time, CPU time, memory and I/O of every stage of a run
+# each stage is one JSON line in logs/run_<date>.jsonl; the worker processes of a run share its run id
+# through the GEO_APP_RUN_ID environment variable so their stages land in the same run
+
+import os
+import sys
+import json
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+# resource is POSIX only; on Windows the peak memory comes from psutil when it is installed
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def default_log_dir() -> str:
+    """The logs directory of the repository, overridable with the GEO_APP_LOG_DIR environment variable"""
+    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return os.environ.get("GEO_APP_LOG_DIR", os.path.join(repo_root, "logs"))
+
+
+def io_counters() -> Dict[str, int]:
+    """The I/O counters of this process from /proc/self/io, or an empty dict where there is none"""
+    try:
+        with open("/proc/self/io") as f:
+            return {name: int(value) for name, value in (line.split(":") for line in f)}
+    except OSError:
+        return {}
+
+
+def peak_rss_mb() -> Optional[float]:
+    """The peak resident set size of this process in megabytes, or None where it cannot be read"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memory = psutil.Process().memory_info()
+    # Windows reports the peak working set; elsewhere psutil only knows the current RSS
+    return getattr(memory, "peak_wset", memory.rss) / (1024 * 1024)
+
+
+class Instrumentation:
+    """Class to measure the stages of a run and log them as JSON lines"""
+
+    def __init__(self, log_dir: Optional[str]=None, enabled: Optional[bool]=None):
+        self.log_dir = log_dir or default_log_dir()
+        # GEO_APP_INSTRUMENT=0 turns the measurements off
+        self.enabled = enabled if enabled is not None else os.environ.get("GEO_APP_INSTRUMENT", "1") != "0"
+        # the stages currently open in this process, outermost first
+        self._stack: List[str] = []
+
+    @property
+    def run_id(self) -> str:
+        """The id of the run, shared with the worker processes started after it was first read"""
+        return os.environ.get("GEO_APP_RUN_ID") or self.new_run()
+
+    def new_run(self) -> str:
+        """Start a new run, e.g. for each job of a long-running process, and return its id"""
+        os.environ["GEO_APP_RUN_ID"] = datetime.now().strftime("%Y%m%dT%H%M%S-") + uuid.uuid4().hex[:6]
+        return os.environ["GEO_APP_RUN_ID"]
+
+    @property
+    def log_path(self) -> str:
+        """The JSON-lines file the stages of the run are appended to"""
+        return self._log_path(self.run_id)
+
+    @contextmanager
+    def stage(self, name: str, **fields) -> Iterator[dict]:
+        """Measure the block as a stage; fields and anything set on the yielded dict are logged with it"""
+        if not self.enabled:
+            yield {}
+            return
+        record = dict(fields)
+        parent = self._stack[-1] if self._stack else None
+        self._stack.append(name)
+        rss_before, io_before = peak_rss_mb(), io_counters()
+        cpu_start, start = time.process_time(), time.perf_counter()
+        status = "ok"
+        try:
+            yield record
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            wall, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+            io_after = io_counters()
+            self._stack.pop()
+            record.update({"run": self.run_id,
+                           "stage": name,
+                           "parent": parent,
+                           "status": status,
+                           "pid": os.getpid(),
+                           "time": datetime.now(timezone.utc).isoformat(),
+                           "wall_s": round(wall, 6),
+                           "cpu_s": round(cpu, 6),
+                           # how much the peak RSS grew during the stage; 0 when an earlier stage peaked higher
+                           "peak_rss_delta_mb": round(peak_rss_mb() - rss_before, 3) if rss_before is not None else None})
+            for counter in ("read_bytes", "write_bytes", "rchar", "wchar"):
+                if counter in io_before:
+                    record[counter] = io_after[counter] - io_before[counter]
+            self._write(record)
+
+    def records(self, run_id: Optional[str]=None, since: Optional[str]=None) -> List[dict]:
+        """The stages logged for a run, by every process of it; the current run by default
+
+        since, an ISO time in UTC, keeps only the stages that finished after it, e.g. those of
+        one Application.execute in a script that runs several.
+        """
+        run_id = run_id or self.run_id
+        try:
+            with open(self._log_path(run_id)) as f:
+                lines = [json.loads(line) for line in f if line.strip()]
+        except OSError:
+            return []
+        return [record for record in lines if record.get("run") == run_id and (since is None or record["time"] >= since)]
+
+    def summary(self, run_id: Optional[str]=None, since: Optional[str]=None) -> str:
+        """A table of the stages of a run, or of those that finished after since, with their totals in the order they first finished"""
+        totals: "OrderedDict[str, dict]" = OrderedDict()
+        for record in self.records(run_id, since):
+            total = totals.setdefault(record["stage"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_delta_mb": 0.0,
+                                                        "read_bytes": 0, "write_bytes": 0})
+            total["count"] += 1
+            total["wall_s"] += record["wall_s"]
+            total["cpu_s"] += record["cpu_s"]
+            total["peak_rss_delta_mb"] = max(total["peak_rss_delta_mb"], record["peak_rss_delta_mb"] or 0.0)
+            total["read_bytes"] += record.get("read_bytes", 0)
+            total["write_bytes"] += record.get("write_bytes", 0)
+        lines = [f"{'stage':<20} {'count':>6} {'wall s':>9} {'cpu s':>9} {'+peak MB':>9} {'read MB':>9} {'write MB':>9}"]
+        for name, total in totals.items():
+            lines.append(f"{name:<20} {total['count']:>6} {total['wall_s']:>9.2f} {total['cpu_s']:>9.2f} "
+                         f"{total['peak_rss_delta_mb']:>9.1f} {total['read_bytes'] / 1e6:>9.1f} {total['write_bytes'] / 1e6:>9.1f}")
+        return "\n".join(lines)
+
+    def _log_path(self, run_id: str) -> str:
+        """The log of a run, one file per day the runs started on"""
+        return os.path.join(self.log_dir, f"run_{run_id[:8]}.jsonl")
+
+    def _write(self, record: dict) -> None:
+        """Append a record to the log; a single short append stays whole when processes share the file"""
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+        except OSError:
+            # a read-only log directory must not fail the run
+            pass
+        return None
+
+
+# the instrumentation shared by the stages of this process
+instrumentation = Instrumentation()
+stage = instrumentation.stage
@@ -0,0 +1,135 @@
+#this script shall profile a run with cProfile, tracemalloc and py-spy and keep the results next to its outputs
+# the files of a run go to <output dir>/profiles/<name>_<time>.* so they can be attached to a perf ticket
+
+import os
+import io
+import json
+import time
+import pstats
+import shutil
+import signal
+import cProfile
+import warnings
+import subprocess
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional
+
+from .Instrumentation import instrumentation
+
+
+@dataclass
+class Profiler:
+    """Class to hold what is captured when a run is profiled"""
+    # the deterministic profile of the calling process, saved as .prof for snakeviz or pstats
+    cprofile: bool = True
+    # the top allocation sites; tracing every allocation slows the run down noticeably
+    tracemalloc: bool = False
+    # the frames traced per allocation
+    tracemalloc_frames: int = 1
+    # a py-spy sampling profile of the process and its workers, when py-spy is installed
+    pyspy: bool = False
+    # the py-spy samples per second
+    pyspy_rate: int = 100
+    # the number of functions and allocation sites listed in the text reports
+    top: int = 30
+    # where the profiles go; None writes them next to the outputs of the run
+    output_dir: Optional[str] = None
+
+    @contextmanager
+    def profile(self, name: str, output_dir: str) -> Iterator[Dict[str, str]]:
+        """Profile the block and write the reports; the yielded dict maps each report to its path once done
+
+        cProfile and tracemalloc only see the calling process; py-spy follows the worker
+        processes too. The stages logged by the instrumentation during the block, with
+        their wall, CPU and I/O counters, are saved alongside.
+        """
+        directory = os.path.join(self.output_dir or output_dir, "profiles")
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, f"{name}_{time.strftime('%Y%m%dT%H%M%S')}")
+        files: Dict[str, str] = {}
+        started = datetime.now(timezone.utc).isoformat()
+
+        sampler = self._start_pyspy(prefix + ".speedscope.json") if self.pyspy else None
+        started_tracing = self.tracemalloc and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(self.tracemalloc_frames)
+        profiler = cProfile.Profile() if self.cprofile else None
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield files
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                files["cprofile"] = prefix + ".prof"
+                profiler.dump_stats(files["cprofile"])
+                files["cprofile_top"] = prefix + ".prof.txt"
+                with open(files["cprofile_top"], "w") as f:
+                    f.write(_top_functions(profiler, self.top))
+            if self.tracemalloc and tracemalloc.is_tracing():
+                files["tracemalloc"] = prefix + ".tracemalloc.txt"
+                with open(files["tracemalloc"], "w") as f:
+                    f.write(_top_allocations(tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()[1], self.top))
+                if started_tracing:
+                    tracemalloc.stop()
+            if sampler is not None:
+                files["pyspy"] = _stop_pyspy(sampler, prefix + ".speedscope.json")
+            # the stages this process and its workers logged while the block ran
+            files["stages"] = prefix + ".stages.jsonl"
+            with open(files["stages"], "w") as f:
+                for record in instrumentation.records(since=started):
+                    f.write(json.dumps(record) + "\n")
+            for key in [key for key, path in files.items() if path is None]:
+                del files[key]
+
+    def _start_pyspy(self, output_path: str) -> Optional[subprocess.Popen]:
+        """Attach py-spy to this process, or warn and carry on when it is missing"""
+        executable = shutil.which("py-spy")
+        if executable is None:
+            warnings.warn("py-spy is not installed; the run is profiled without it.")
+            return None
+        return subprocess.Popen([executable, "record", "--pid", str(os.getpid()), "--subprocesses", "--nonblocking",
+                                 "--rate", str(self.pyspy_rate), "--format", "speedscope", "--output", output_path],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def _stop_pyspy(sampler: subprocess.Popen, output_path: str) -> Optional[str]:
+    """Stop py-spy so it writes its profile, and return the path when it did"""
+    if sampler.poll() is None:
+        sampler.send_signal(signal.SIGINT)
+    try:
+        _, stderr = sampler.communicate(timeout=60)
+    except subprocess.TimeoutExpired:
+        sampler.kill()
+        _, stderr = sampler.communicate()
+    if not os.path.exists(output_path):
+        # py-spy needs ptrace rights on the process, which containers often withhold
+        warnings.warn(f"py-spy wrote no profile: {stderr.decode(errors='replace').strip()}")
+        return None
+    return output_path
+
+
+def _top_functions(profiler: cProfile.Profile, top: int) -> str:
+    """The functions with the highest cumulative time"""
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    return stream.getvalue()
+
+
+def _top_allocations(snapshot: tracemalloc.Snapshot, peak: int, top: int) -> str:
+    """The allocation sites holding the most memory at the end of the block"""
+    # the allocations of tracemalloc itself and of the import machinery are noise
+    snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),
+                                       tracemalloc.Filter(False, __file__),
+                                       tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                                       tracemalloc.Filter(False, "<unknown>")))
+    stats = snapshot.statistics("lineno")
+    lines = [f"peak traced memory: {peak / 1e6:.1f} MB",
+             f"live traced memory: {sum(stat.size for stat in stats) / 1e6:.1f} MB",
+             ""]
+    lines += [str(stat) for stat in stats[:top]]
+    return "\n".join(lines) + "\n"
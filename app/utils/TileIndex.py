@@ -0,0 +1,109 @@
+#this script shall index the footprints of raster tiles so only the tiles intersecting an area are read
+
+import os
+import json
+import numpy as np
+import rasterio
+from shapely import STRtree, box
+from dataclasses import dataclass, asdict
+from typing import List, Optional, Tuple
+
+
+@dataclass
+class TileInfo:
+    """Class to hold the header metadata of a raster tile"""
+    path: str
+    # the bounds of the tile as (left, bottom, right, top)
+    bounds: Tuple[float, float, float, float]
+    # the pixel size of the tile as (x, y)
+    res: Tuple[float, float]
+    count: int
+    dtype: str
+    nodata: Optional[float]
+    # the crs of the tile as wkt
+    crs: Optional[str]
+    # the file size and modification time used to tell whether a stored header is still valid
+    size: int = 0
+    mtime_ns: int = 0
+
+
+def read_tile_info(path: str) -> TileInfo:
+    """Read the header metadata of a raster tile without reading any pixels"""
+    stat = os.stat(path)
+    with rasterio.open(path) as src:
+        return TileInfo(path=path,
+                        bounds=tuple(src.bounds),
+                        res=tuple(src.res),
+                        count=src.count,
+                        dtype=src.dtypes[0],
+                        nodata=src.nodata,
+                        crs=src.crs.to_wkt() if src.crs else None,
+                        size=stat.st_size,
+                        mtime_ns=stat.st_mtime_ns)
+
+
+class TileIndex:
+    """Class to hold an STR-tree over the footprints of raster tiles"""
+
+    def __init__(self, tiles: List[TileInfo]):
+        if not tiles:
+            raise ValueError("At least one raster tile should be given.")
+        self.tiles = tiles
+        # index the tile footprints; the order of the tiles is kept so "first" still means first given
+        self._tree = STRtree([box(*tile.bounds) for tile in tiles])
+
+    @classmethod
+    def from_paths(cls, raster_paths: List[str], index_path: Optional[str]=None) -> "TileIndex":
+        """Build the index from the tile headers, reusing the sidecar file when it is still valid"""
+        if index_path and os.path.exists(index_path):
+            index = cls.load(index_path)
+            if index.matches(raster_paths):
+                return index
+        index = cls([read_tile_info(path) for path in raster_paths])
+        if index_path:
+            index.save(index_path)
+        return index
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """Union bounds of all the tiles"""
+        return (min(tile.bounds[0] for tile in self.tiles),
+                min(tile.bounds[1] for tile in self.tiles),
+                max(tile.bounds[2] for tile in self.tiles),
+                max(tile.bounds[3] for tile in self.tiles))
+
+    def query(self, bounds: Tuple[float, float, float, float]) -> List[TileInfo]:
+        """Return the tiles whose footprint intersects the bounds, in the order they were given"""
+        indices = np.sort(self._tree.query(box(*bounds)))
+        return [self.tiles[i] for i in indices]
+
+    def matches(self, raster_paths: List[str]) -> bool:
+        """Check the index was built from the same tiles and none of them changed on disk"""
+        if [tile.path for tile in self.tiles] != list(raster_paths):
+            return False
+        for tile in self.tiles:
+            try:
+                stat = os.stat(tile.path)
+            except OSError:
+                return False
+            if stat.st_size != tile.size or stat.st_mtime_ns != tile.mtime_ns:
+                return False
+        return True
+
+    def save(self, index_path: str) -> None:
+        """Save the tile headers to a json sidecar file"""
+        with open(index_path, "w") as f:
+            json.dump({"tiles": [asdict(tile) for tile in self.tiles]}, f)
+        return None
+
+    @classmethod
+    def load(cls, index_path: str) -> "TileIndex":
+        """Load the tile headers from a json sidecar file"""
+        with open(index_path) as f:
+            records = json.load(f)["tiles"]
+        tiles = []
+        for record in records:
+            record["bounds"] = tuple(record["bounds"])
+            record["res"] = tuple(record["res"])
+            tiles.append(TileInfo(**record))
+        return cls(tiles)